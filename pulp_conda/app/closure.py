@@ -0,0 +1,120 @@
+"""
+Dependency closures of conda match specs over the package records of a channel.
+"""
+import sys
+from collections import defaultdict, namedtuple
+
+from .match_spec import InvalidMatchSpec, parse_match_spec
+from .version import InvalidVersion, parse_version
+
+IndexEntry = namedtuple(
+    "IndexEntry", ["subdir", "filename", "version", "build", "build_number", "depends"]
+)
+
+
+class PackageIndex:
+    """
+    An in-memory index of package records by package name.
+
+    Only the fields needed to match specs and follow dependencies are kept. The dependency
+    strings are interned, as the same few thousand of them repeat across a whole channel.
+    """
+
+    __slots__ = ("packages",)
+
+    def __init__(self):
+        self.packages = defaultdict(list)
+
+    def add(self, subdir, filename, record):
+        """
+        Adds a package record to the index, records with an invalid version are ignored.
+
+        Args:
+            subdir (str): The subdir of the package.
+            filename (str): The filename of the package.
+            record (dict): The repodata.json record of the package.
+        """
+        try:
+            version = parse_version(record.get("version", ""))
+        except InvalidVersion:
+            return
+        self.packages[record.get("name", "")].append(
+            IndexEntry(
+                subdir,
+                filename,
+                version,
+                record.get("build", ""),
+                record.get("build_number"),
+                tuple(sys.intern(depend) for depend in record.get("depends", ())),
+            )
+        )
+
+    def matching(self, spec, subdirs):
+        """
+        Returns the entries of the given subdirs matching a match spec.
+        """
+        if "*" in spec.name:
+            names = [name for name in self.packages if spec.match_name(name)]
+        else:
+            names = [spec.name]
+        return [
+            entry
+            for name in names
+            for entry in self.packages.get(name, ())
+            if entry.subdir in subdirs
+            and spec.match(name, entry.version, entry.build, entry.build_number)
+        ]
+
+
+def dependency_closure(index, root_specs):
+    """
+    Selects the packages matching the root specs and their transitive dependencies.
+
+    All packages matching a root spec are selected. For every dependency of a selected package,
+    all builds of the latest version matching it are selected, like conda does for
+    current_repodata.json. The closure is computed for every platform subdir together with
+    noarch, as a client of that platform sees both.
+
+    Args:
+        index (PackageIndex): The packages of all subdirs.
+        root_specs (list): The parsed `MatchSpec` objects of the root specs.
+
+    Returns:
+        dict: The selected filenames of every subdir.
+    """
+    subdirs = {entry.subdir for entries in index.packages.values() for entry in entries}
+    platforms = subdirs - {"noarch"} or subdirs
+    selected = defaultdict(set)
+
+    for platform in platforms:
+        universe = {platform, "noarch"}
+        resolved = set()
+        seen = set()
+        queue = []
+
+        def select(entries):
+            for entry in entries:
+                if (entry.subdir, entry.filename) not in seen:
+                    seen.add((entry.subdir, entry.filename))
+                    selected[entry.subdir].add(entry.filename)
+                    queue.append(entry)
+
+        for spec in root_specs:
+            select(index.matching(spec, universe))
+
+        while queue:
+            for depend in queue.pop().depends:
+                # The latest match of a dependency does not depend on who depends on it.
+                if depend in resolved:
+                    continue
+                resolved.add(depend)
+                try:
+                    spec = parse_match_spec(depend)
+                except InvalidMatchSpec:
+                    continue
+                entries = index.matching(spec, universe)
+                if entries:
+                    latest = max(entries, key=lambda entry: entry.version).version
+                    select(entry for entry in entries if entry.version == latest)
+
+    return selected
@@ -0,0 +1,458 @@
+"""
+Content app support for pull-through and on-demand distributions.
+
+Concurrent requests for the same missing file share a single upstream download, a "flight". The
+first request starts the download in a task of its own, so it continues when that client goes
+away. Every request streams the file from the temporary file of the download while it grows.
+Once downloaded, the file is stored once, as artifact and content.
+
+Flights are coordinated within a content app process. Across processes, concurrent stores of the
+same artifact or content fall back to the existing rows.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from gettext import gettext as _
+
+from aiohttp import ClientResponseError, web
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from pulpcore.plugin.download import DownloaderFactory
+from pulpcore.plugin.models import Artifact, ContentArtifact, RemoteArtifact
+
+from .downloaders import FlightDownloader
+from .shards import SHARDS_INDEX
+from .utils import extract_package_info
+
+log = logging.getLogger(__name__)
+
+# The size of the chunks served from a downloaded file.
+CHUNK_SIZE = 1024 * 1024
+
+# The published metadata files held by the metadata cache, by basename.
+CACHED_METADATA = frozenset(
+    [
+        f"{name}{suffix}"
+        for name in ("repodata.json", "current_repodata.json")
+        for suffix in ("", ".zst", ".bz2", ".gz")
+    ]
+    + ["repodata.jlap", "channeldata.json", SHARDS_INDEX]
+)
+
+# The published variant of a negotiated metadata file served for each Content-Encoding, by
+# preference.
+ENCODINGS = {"zstd": ".zst", "gzip": ".gz"}
+
+# The running flights by remote and url.
+_flights = {}
+
+# The downloader factories of the remotes, which share one session per remote.
+_factories = {}
+
+
+def accepted_encodings(header):
+    """
+    Returns the encodings of `ENCODINGS` an Accept-Encoding header accepts, by preference.
+
+    Args:
+        header (str): The value of the Accept-Encoding header.
+    """
+    qualities = {}
+    for coding in header.split(","):
+        name, _sep, params = coding.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _sep, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    accepted = [encoding for encoding in ENCODINGS if qualities.get(encoding, 0.0) > 0]
+    # The order of ENCODINGS breaks ties, as sorting is stable.
+    return sorted(accepted, key=lambda encoding: -qualities[encoding])
+
+
+def artifact_path(artifact):
+    """
+    Returns the local path of the file of an artifact, None for storages without local files.
+    """
+    try:
+        return artifact.file.path
+    except NotImplementedError:
+        return None
+
+
+class NegotiatedResponse(web.Response):
+    """
+    A response serving the variant of a file whose encoding the request accepts.
+
+    The variant is chosen once the request is known, i.e. when the response is prepared. A
+    variant the client already has, by its ETag, is answered with "304 Not Modified".
+    """
+
+    def __init__(self, variants, vary, **kwargs):
+        """
+        Args:
+            variants (dict): The ``(body, etag)`` of every variant by encoding, None for the file
+                itself. The body is either the content or the local path of the file.
+            vary (bool): Whether the variant depends on the Accept-Encoding header.
+        """
+        super().__init__(**kwargs)
+        self._variants = variants
+        self._vary = vary
+
+    async def prepare(self, request):
+        if self._variants is not None:
+            variants, self._variants = self._variants, None
+            accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+            encoding = next((encoding for encoding in accepted if encoding in variants), None)
+            body, etag = variants[encoding]
+
+            self.headers["ETag"] = etag
+            if self._vary:
+                self.headers["Vary"] = "Accept-Encoding"
+            if encoding is not None:
+                self.headers["Content-Encoding"] = encoding
+            if etag in request.headers.get("If-None-Match", ""):
+                self.set_status(web.HTTPNotModified.status_code)
+            elif isinstance(body, bytes):
+                self.body = body
+            else:
+                # Streamed in chunks.
+                self.body = open(body, "rb")
+        return await super().prepare(request)
+
+
+class DownloadRestarted(Exception):
+    """
+    Raised to a reader of a flight whose download restarted after it was partially served.
+    """
+
+
+class Flight:
+    """
+    A single upstream download streamed to any number of readers.
+
+    The temporary file of the download is removed once the download, the store and all readers
+    are done.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.size = 0
+        self.finished = False
+        self.error = None
+        # The download itself holds a reference until the file is stored.
+        self.references = 1
+        self.changed = asyncio.Condition()
+
+    async def advance(self, path, size):
+        """
+        Reports that the download wrote ``size`` more bytes to the file at ``path``.
+        """
+        async with self.changed:
+            if path != self.path:
+                # The download was retried with a new file.
+                self.path, self.size = path, 0
+            self.size += size
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        """
+        Reports that the download ended, with the given error if it failed.
+        """
+        async with self.changed:
+            self.finished = True
+            self.error = error
+            self.changed.notify_all()
+
+    def release(self):
+        """
+        Drops a reference to the file, and removes the file with the last one.
+        """
+        self.references -= 1
+        if self.references == 0 and self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def read(self):
+        """
+        Returns an async generator yielding the content of the file as it is downloaded.
+
+        The file is opened right away, because it is moved to the artifact storage once the
+        download finished.
+        """
+        self.references += 1
+        fileobj = open(self.path, "rb") if self.path is not None else None
+        return self._read(self.path, fileobj)
+
+    async def _read(self, path, fileobj):
+        """
+        Raises:
+            DownloadRestarted: If the download restarted after a part of it was yielded.
+            Exception: The error of a failed download.
+        """
+        offset = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(
+                        lambda: self.finished or (self.path != path or self.size > offset)
+                    )
+                if self.error is not None:
+                    raise self.error
+                if self.path != path:
+                    if offset:
+                        raise DownloadRestarted(_("The download restarted, retry the request."))
+                    path = self.path
+                    fileobj = open(path, "rb")
+                while offset < self.size:
+                    chunk = fileobj.read(min(CHUNK_SIZE, self.size - offset))
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    yield chunk
+                if self.finished and offset >= self.size:
+                    return
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+            self.release()
+
+
+async def _resume(first, chunks):
+    yield first
+    async for chunk in chunks:
+        yield chunk
+
+
+class FlightResponse(web.Response):
+    """
+    A response streaming a flight, whose status is only decided once the download started.
+
+    The first chunk of the file, or the error of the download, is awaited before the headers are
+    sent. A file missing upstream is served as 404, any other failed download as 502.
+    """
+
+    def __init__(self, chunks, **kwargs):
+        super().__init__(**kwargs)
+        self._chunks = chunks
+
+    async def prepare(self, request):
+        if self._chunks is not None:
+            chunks, self._chunks = self._chunks, None
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                self.body = b""
+            except Exception as exc:
+                self.content_type = "text/plain"
+                if isinstance(exc, ClientResponseError) and exc.status == 404:
+                    self.set_status(web.HTTPNotFound.status_code)
+                    self.text = _("Not found upstream.")
+                else:
+                    self.set_status(web.HTTPBadGateway.status_code)
+                    self.text = _("Failed to download the file from the remote.")
+            else:
+                self.body = _resume(first, chunks)
+        return await super().prepare(request)
+
+
+def _factory(remote):
+    key = (remote.pk, remote.pulp_last_updated)
+    if key not in _factories:
+        _factories[key] = DownloaderFactory(
+            remote, downloader_overrides={"http": FlightDownloader, "https": FlightDownloader}
+        )
+    return _factories[key]
+
+
+async def _fly(key, flight, remote, url, store):
+    try:
+        try:
+            result = await _factory(remote).build(url, flight=flight).run()
+        except Exception as exc:
+            log.warning(_("Failed to download {}: {}").format(url, exc))
+            await flight.finish(exc)
+            return
+        finally:
+            # Later requests find the stored content, or start a new flight after a failure.
+            _flights.pop(key, None)
+
+        await flight.finish()
+        try:
+            await sync_to_async(store)(result)
+        except Exception as exc:
+            log.warning(_("Failed to store {}: {}").format(url, exc))
+    finally:
+        # The download drops its reference, whether it failed or not.
+        flight.release()
+
+
+def single_flight(remote, url, store):
+    """
+    Streams a file of a remote, sharing the download with concurrent requests for it.
+
+    Args:
+        remote (CondaRemote): The remote to download from.
+        url (str): The url of the file.
+        store (callable): Called with the `DownloadResult` of the download to store it, once.
+
+    Returns:
+        An async generator yielding the content of the file.
+    """
+    key = (remote.pk, url)
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = Flight()
+        asyncio.get_running_loop().create_task(_fly(key, flight, remote, url, store))
+    return flight.read()
+
+
+def _save_artifact(remote, result):
+    """
+    Saves the artifact of a download, or returns the existing one with the same digest.
+    """
+    artifact = Artifact(
+        **result.artifact_attributes, file=result.path, pulp_domain=remote.pulp_domain
+    )
+    try:
+        with transaction.atomic():
+            artifact.save()
+    except IntegrityError:
+        artifact = Artifact.objects.get(
+            sha256=result.artifact_attributes["sha256"], pulp_domain=remote.pulp_domain
+        )
+    return artifact
+
+
+async def fetch_remote_package(remote, url, relative_path, content_artifact=None):
+    """
+    Fetches a package missing from the artifact storage, stores it and yields its content.
+
+    Args:
+        remote (CondaRemote): The remote to download the package from.
+        url (str): The url of the package.
+        relative_path (str): The path of the package relative to the distribution.
+        content_artifact (ContentArtifact): The content artifact of an on-demand package, which
+            gets the downloaded artifact. If None, the Package is created from the artifact and
+            linked to the remote and url by a RemoteArtifact.
+    """
+    from .models import Package
+
+    def store(result):
+        artifact = _save_artifact(remote, result)
+        if content_artifact is not None:
+            ContentArtifact.objects.filter(pk=content_artifact.pk, artifact__isnull=True).update(
+                artifact=artifact
+            )
+            return
+        _name, _version, _build, extension = extract_package_info(relative_path)
+        metadata = Package.metadata_from_artifact(artifact, extension)
+        package = Package.get_or_create_from_artifact(relative_path, artifact, metadata)
+        # The package may have existed without an artifact, e.g. synced on demand.
+        ContentArtifact.objects.filter(content=package, artifact__isnull=True).update(
+            artifact=artifact
+        )
+        # Links the package to the remote and url, so pulpcore serves it from now on.
+        try:
+            with transaction.atomic():
+                RemoteArtifact.objects.get_or_create(
+                    content_artifact=ContentArtifact.objects.get(content=package),
+                    remote=remote,
+                    defaults={"url": url, "size": artifact.size, "sha256": artifact.sha256},
+                )
+        except IntegrityError:
+            pass
+
+    async for chunk in single_flight(remote, url, store):
+        yield chunk
+
+
+async def fetch_remote_repodata(remote, relative_path):
+    """
+    Fetches a repodata.json from a remote, caches it and yields its content.
+
+    Args:
+        remote (CondaRemote): The remote of the pull-through distribution.
+        relative_path (str): The path of the file relative to the remote url.
+    """
+    from .models import RepodataCache
+
+    def store(result):
+        RepodataCache.store(remote, relative_path, result)
+
+    url = remote.get_remote_artifact_url(relative_path)
+    async for chunk in single_flight(remote, url, store):
+        yield chunk
+
+
+class MetadataCache:
+    """
+    An LRU cache of published metadata files, bounded by their total size.
+
+    Entries are keyed by publication and relative path, and hold the content and the ETag of the
+    file. When a distribution switches to another
+    publication, the entries of the one it served before are dropped. The size is set by
+    ``CONDA_METADATA_CACHE_SIZE``, the cache is disabled if it is 0.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._size = 0
+        self._served = {}
+        self._lock = threading.Lock()
+
+    def get(self, publication_pk, relative_path):
+        """
+        Returns the cached ``(data, etag)`` of a file, or None.
+        """
+        with self._lock:
+            entry = self._entries.get((publication_pk, relative_path))
+            if entry is not None:
+                self._entries.move_to_end((publication_pk, relative_path))
+            return entry
+
+    def put(self, publication_pk, relative_path, data, etag):
+        """
+        Caches the content of a file, evicting the least recently used files beyond the size.
+        """
+        max_size = settings.CONDA_METADATA_CACHE_SIZE
+        if len(data) > max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop((publication_pk, relative_path), None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[(publication_pk, relative_path)] = (data, etag)
+            self._size += len(data)
+            while self._size > max_size:
+                _key, (evicted, _etag) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def serve(self, distribution_pk, publication_pk):
+        """
+        Records the publication a distribution serves, invalidating the one it served before.
+        """
+        with self._lock:
+            previous = self._served.get(distribution_pk)
+            if previous == publication_pk:
+                return
+            self._served[distribution_pk] = publication_pk
+            if previous is None or previous in self._served.values():
+                return
+            for key in [key for key in self._entries if key[0] == previous]:
+                self._size -= len(self._entries.pop(key)[0])
+
+
+metadata_cache = MetadataCache()
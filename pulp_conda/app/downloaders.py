@@ -0,0 +1,121 @@
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from pulpcore.plugin.download import DownloaderFactory, DownloadResult, HttpDownloader
+
+
+class NotModified(Exception):
+    """
+    Raised by `RepodataDownloader` if the server answers "304 Not Modified".
+    """
+
+    def __init__(self, headers):
+        super().__init__()
+        self.headers = headers
+
+
+class RepodataDownloader(HttpDownloader):
+    """
+    A downloader for repodata.json files, which sends conditional requests.
+
+    If the ETag or the Last-Modified date of the previous download is given and the file has not
+    changed since, the server answers with "304 Not Modified". The result of such a download has
+    neither a path nor artifact attributes.
+
+    It is built by a `DownloaderFactory`, see `repodata_downloader_factory`.
+    """
+
+    def __init__(self, url, session, etag=None, last_modified=None, **kwargs):
+        """
+        Args:
+            url (str): The url to download.
+            session (aiohttp.ClientSession): The session of the factory.
+            etag (str): The ETag of the previous download, if any.
+            last_modified (str): The Last-Modified header of the previous download, if any.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        self.conditional_session = None
+        if headers:
+            # The conditional headers are sent as the default headers of a session of its own,
+            # which shares the connection pool of the session of the factory.
+            session = self.conditional_session = aiohttp.ClientSession(
+                connector=session.connector,
+                connector_owner=False,
+                headers={**session.headers, **headers},
+                timeout=session.timeout,
+                auth=session.auth,
+                requote_redirect_url=session.requote_redirect_url,
+            )
+        super().__init__(url, session=session, **kwargs)
+
+    def raise_for_status(self, response):
+        """
+        Raise `NotModified` for a "304 Not Modified" response, which has no body to store.
+        """
+        if response.status == 304:
+            raise NotModified(response.headers)
+        super().raise_for_status(response)
+
+    async def run(self, extra_data=None):
+        """
+        Download the repodata.json, unless it has not been modified.
+        """
+        try:
+            return await super().run(extra_data=extra_data)
+        except NotModified as exc:
+            return DownloadResult(
+                url=self.url, artifact_attributes=None, path=None, headers=exc.headers
+            )
+        finally:
+            if self.conditional_session is not None:
+                await self.conditional_session.close()
+
+
+@asynccontextmanager
+async def repodata_downloader_factory(remote):
+    """
+    Returns a `DownloaderFactory` building `RepodataDownloader`, whose session is closed on exit.
+
+    Args:
+        remote (CondaRemote): The remote to download from.
+    """
+    factory = DownloaderFactory(
+        remote, downloader_overrides={"http": RepodataDownloader, "https": RepodataDownloader}
+    )
+    try:
+        yield factory
+    finally:
+        # Unlike the factory of a remote, this one is not reused, but DownloaderFactory does not
+        # close the session it creates.
+        await factory._session.close()
+
+
+class FlightDownloader(HttpDownloader):
+    """
+    A downloader, which reports every chunk written to its file to a single-flight download.
+
+    Other requests for the same file stream it from the file while it is being downloaded, see
+    `pulp_conda.app.content`.
+    """
+
+    def __init__(self, *args, flight, **kwargs):
+        """
+        Args:
+            flight (pulp_conda.app.content.Flight): The single-flight download to report to.
+        """
+        self.flight = flight
+        super().__init__(*args, **kwargs)
+
+    async def handle_data(self, data):
+        """
+        Write the data to the file, and make it visible to the readers of the flight.
+        """
+        await super().handle_data(data)
+        self._writer.flush()
+        await self.flight.advance(self.path, len(data))
@@ -0,0 +1,90 @@
+"""
+Upload handling for conda packages.
+"""
+import hashlib
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, TemporaryFileUploadHandler
+
+from pulpcore.plugin.models import Artifact
+
+# The size of the chunks copied by `hashed_upload`.
+CHUNK_SIZE = 1024 * 1024
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    """
+    A temporary upload, which is hashed while it is written.
+
+    Besides the digests of the artifact, the md5 digest conda expects in every package record is
+    computed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashers = {name: hashlib.new(name) for name in Artifact.DIGEST_FIELDS}
+        self.md5_hasher = hashlib.md5(usedforsecurity=False)
+
+    def write(self, data):
+        self.md5_hasher.update(data)
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        return self.file.write(data)
+
+
+class PackageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Hashes an uploaded package while the request body streams in.
+
+    The upload is written to a temporary file once, which is moved into the artifact storage when
+    the artifact is saved, so the package is never read again as a whole.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # The temporary file of TemporaryFileUploadHandler is replaced by one that is hashed.
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = HashedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+
+def uploaded_md5(file):
+    """
+    Returns the md5 hex digest of a `HashedUploadedFile`, if available.
+    """
+    hasher = getattr(file, "md5_hasher", None)
+    return hasher.hexdigest() if hasher is not None else None
+
+
+def uploaded_artifact(file):
+    """
+    Returns the unsaved artifact of an upload.
+
+    The digests of a `HashedUploadedFile` are used, any other file is read to compute them.
+    """
+    hashers = getattr(file, "hashers", None)
+    if hashers is None:
+        return Artifact.init_and_validate(file)
+    digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+    return Artifact(file=file, size=file.size, **digests)
+
+
+def hashed_upload(filename, fileobj, size):
+    """
+    Copies a file, e.g. a member of an uploaded archive, to a temporary upload.
+
+    The upload is hashed while it is copied, just like one received by `PackageUploadHandler`.
+
+    Args:
+        filename (str): The name of the upload.
+        fileobj: A binary file object to copy.
+        size (int): The size of the file.
+
+    Returns:
+        HashedUploadedFile: The upload, positioned at its start.
+    """
+    upload = HashedUploadedFile(filename, "application/octet-stream", size, None)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
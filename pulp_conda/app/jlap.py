@@ -0,0 +1,149 @@
+"""
+Support for repodata.jlap, a log of JSON patches between successive repodata.json states.
+
+A ``.jlap`` file consists of lines. The first line is a hex encoded 256-bit initialization vector.
+It is followed by one JSON object per patch, oldest first, each with the keys ``from``, ``to``
+and ``patch``, a JSON object with the ``latest`` hash of the repodata.json, and finally the hex
+encoded running checksum. The running checksum of a line is the keyed BLAKE2b-256 digest of the
+line, using the running checksum of the previous line as key.
+"""
+import json
+from hashlib import blake2b
+
+from .utils import iter_repodata_packages, read_repodata_info
+
+DIGEST_SIZE = 32
+DEFAULT_IV = bytes(DIGEST_SIZE)
+
+
+def repodata_hash(fileobj):
+    """
+    Computes the BLAKE2b-256 digest, which identifies a repodata.json state in a jlap file.
+
+    Args:
+        fileobj: A binary file object containing a repodata.json document.
+
+    Returns:
+        str: The hex digest of the document.
+    """
+    fileobj.seek(0)
+    hasher = blake2b(digest_size=DIGEST_SIZE)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _record_digest(record):
+    return blake2b(
+        json.dumps(record, sort_keys=True).encode(), digest_size=DIGEST_SIZE // 2
+    ).digest()
+
+
+def _pointer(section, filename):
+    # RFC 6901 escaping of the JSON pointer reference tokens.
+    return "/{}/{}".format(section, filename.replace("~", "~0").replace("/", "~1"))
+
+
+def diff_repodata(old, new):
+    """
+    Computes the RFC 6902 JSON patch from one repodata.json document to another.
+
+    Both documents are parsed incrementally. Only a digest of every package record of the old
+    document is kept in memory, which is a small fraction of the size of the records themselves.
+
+    Args:
+        old: A binary file object containing the old repodata.json document.
+        new: A binary file object containing the new repodata.json document.
+
+    Returns:
+        list: The operations of the patch.
+    """
+    digests = {}
+    for filename, record in iter_repodata_packages(old):
+        digests[filename] = _record_digest(record)
+
+    patch = []
+    old_info = read_repodata_info(old)
+    new_info = read_repodata_info(new)
+    if old_info != new_info:
+        patch.append({"op": "replace", "path": "/info", "value": new_info})
+
+    for filename, record in iter_repodata_packages(new):
+        if digests.pop(filename, None) != _record_digest(record):
+            section = "packages.conda" if filename.endswith(".conda") else "packages"
+            patch.append({"op": "add", "path": _pointer(section, filename), "value": record})
+
+    for filename in digests:
+        section = "packages.conda" if filename.endswith(".conda") else "packages"
+        patch.append({"op": "remove", "path": _pointer(section, filename)})
+
+    return patch
+
+
+def _running_checksum(iv, lines):
+    checksum = iv
+    for line in lines:
+        checksum = blake2b(line.encode(), key=checksum, digest_size=DIGEST_SIZE).digest()
+    return checksum
+
+
+def read_jlap(fileobj):
+    """
+    Reads the patches of a jlap file.
+
+    Args:
+        fileobj: A binary file object containing a jlap file.
+
+    Returns:
+        tuple: The initialization vector and the list of patch lines. A jlap file whose checksum
+            does not match is discarded, i.e. ``(DEFAULT_IV, [])`` is returned.
+    """
+    lines = fileobj.read().decode().split("\n")
+    if len(lines) < 3:
+        return DEFAULT_IV, []
+
+    try:
+        iv = bytes.fromhex(lines[0])
+    except ValueError:
+        return DEFAULT_IV, []
+    if _running_checksum(iv, lines[1:-1]).hex() != lines[-1]:
+        return DEFAULT_IV, []
+
+    # The last two lines are the metadata line and the checksum, which are rewritten anyway.
+    return iv, lines[1:-2]
+
+
+def write_jlap(fileobj, iv, patches, latest, max_size):
+    """
+    Writes a jlap file, dropping the oldest patches to stay below a maximum size.
+
+    Args:
+        fileobj: A binary file object to write the jlap file to.
+        iv (bytes): The initialization vector of the first of the patch lines.
+        patches (list): The patch lines, oldest first.
+        latest (str): The hash of the repodata.json the last patch leads to.
+        max_size (int): The maximum size of the jlap file in bytes.
+    """
+    metadata = json.dumps({"url": "repodata.json", "latest": latest}, separators=(",", ":"))
+    # Every line is terminated by a newline, except the checksum line.
+    size = 2 * (2 * DIGEST_SIZE) + 2 + len(metadata) + sum(len(line) + 1 for line in patches)
+
+    trimmed = 0
+    while trimmed < len(patches) and size > max_size:
+        size -= len(patches[trimmed]) + 1
+        trimmed += 1
+    # The running checksum of the last dropped line is the new initialization vector.
+    iv = _running_checksum(iv, patches[:trimmed])
+    lines = patches[trimmed:] + [metadata]
+
+    fileobj.write(iv.hex().encode())
+    for line in lines:
+        fileobj.write(b"\n" + line.encode())
+    fileobj.write(b"\n" + _running_checksum(iv, lines).hex().encode())
+
+
+def patch_line(old_hash, new_hash, patch):
+    """
+    Returns the jlap line of a patch from one repodata.json state to the next.
+    """
+    return json.dumps({"from": old_hash, "to": new_hash, "patch": patch}, separators=(",", ":"))
@@ -0,0 +1,142 @@
+"""
+Conda match specs, following the semantics of ``conda.models.match_spec``.
+"""
+import re
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from gettext import gettext as _
+
+from .version import InvalidVersion, VersionSpec
+
+BRACKET_RE = re.compile(r"^(?P<spec>[^\[]*)\[(?P<args>.*)\]\s*$")
+BRACKET_ARG_RE = re.compile(
+    r"""(?P<key>\w+)\s*=\s*"""
+    r"""(?:'(?P<sq>[^']*)'|"(?P<dq>[^"]*)"|(?P<raw>[^,]*))"""
+)
+NAME_RE = re.compile(r"^(?P<name>[^\s=<>!~]+)\s*(?P<rest>.*)$")
+
+
+class InvalidMatchSpec(ValueError):
+    """
+    Raised when a match spec string cannot be parsed.
+    """
+
+
+class MatchSpec:
+    """
+    A conda match spec, e.g. "numpy >=1.21,<2", "python=3.11" or "libblas * *mkl".
+
+    Supported are the name, version and build of a spec, in the space separated, the "="
+    separated and the bracket form. A channel prefix like "conda-forge::" is ignored. Names and
+    builds may contain "*" wildcards.
+    """
+
+    __slots__ = ("spec", "name", "version", "build", "build_number")
+
+    def __init__(self, spec):
+        """
+        Args:
+            spec (str): The match spec string.
+
+        Raises:
+            InvalidMatchSpec: If the spec string cannot be parsed.
+        """
+        self.spec = str(spec).strip()
+        spec = self.spec.split("#", 1)[0].strip()
+        if "::" in spec:
+            spec = spec.split("::", 1)[1]
+
+        args = {}
+        match = BRACKET_RE.match(spec)
+        if match:
+            spec = match.group("spec").strip()
+            for arg in BRACKET_ARG_RE.finditer(match.group("args")):
+                value = arg.group("sq") or arg.group("dq") or arg.group("raw") or ""
+                args[arg.group("key")] = value.strip()
+
+        # Remove blanks around operators, e.g. "numpy >= 1.21, < 2" becomes "numpy >=1.21,<2".
+        spec = re.sub(r"\s*([,|])\s*", r"\1", spec)
+        spec = re.sub(r"(==|!=|<=|>=|~=|<|>)\s+", r"\1", spec)
+
+        match = NAME_RE.match(spec)
+        if not match:
+            raise InvalidMatchSpec(_("Invalid match spec: {}").format(self.spec))
+        self.name = match.group("name")
+        version, build = _split_version_build(match.group("rest").strip())
+
+        version = args.get("version", version)
+        build = args.get("build", build)
+        try:
+            self.version = VersionSpec(version) if version and version != "*" else None
+        except InvalidVersion as exc:
+            raise InvalidMatchSpec(str(exc)) from exc
+        self.build = build if build and build != "*" else None
+        self.build_number = int(args["build_number"]) if args.get("build_number") else None
+
+    def __str__(self):
+        return self.spec
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}("{self.spec}")'
+
+    def match_name(self, name):
+        """
+        Whether a package name matches the spec.
+        """
+        if "*" in self.name:
+            return fnmatchcase(name, self.name)
+        return name == self.name
+
+    def match(self, name, version, build, build_number=None):
+        """
+        Whether a package matches the spec.
+
+        Args:
+            name (str): The name of the package.
+            version (str or VersionOrder): The version of the package.
+            build (str): The build string of the package.
+            build_number (int): The build number of the package.
+        """
+        if not self.match_name(name):
+            return False
+        if self.version is not None and not self.version.match(version):
+            return False
+        if self.build is not None and not fnmatchcase(build, self.build):
+            return False
+        if self.build_number is not None and build_number != self.build_number:
+            return False
+        return True
+
+
+def _split_version_build(rest):
+    if not rest:
+        return None, None
+
+    if " " in rest:
+        # The space separated form "version build", where a bare version is exact.
+        version, build = rest.split(None, 1)
+        return version, build.strip()
+
+    if rest.startswith("=") and not rest.startswith("=="):
+        # The "=" separated form "=version" or "=version=build". Without a build, the version
+        # is fuzzy, i.e. "=1.2" matches "1.2.*".
+        version, _sep, build = rest[1:].partition("=")
+        if build:
+            return version, build
+        return f"={version}", None
+
+    return rest, None
+
+
+@lru_cache(maxsize=65536)
+def parse_match_spec(spec):
+    """
+    Parses a match spec string, caching the result.
+
+    Args:
+        spec (str): The match spec string.
+
+    Returns:
+        MatchSpec: The parsed match spec.
+    """
+    return MatchSpec(spec)
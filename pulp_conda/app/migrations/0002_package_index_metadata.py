@@ -0,0 +1,70 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="package",
+            name="subdir",
+            field=models.CharField(default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="build_number",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="depends",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="constrains",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="license",
+            field=models.TextField(default=""),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="noarch",
+            field=models.CharField(default="", max_length=16),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="timestamp",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="md5",
+            field=models.CharField(default="", max_length=32),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="sha256",
+            field=models.CharField(db_index=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="size",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="extra_metadata",
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddIndex(
+            model_name="package",
+            index=models.Index(fields=["name", "subdir"], name="conda_package_name_subdir"),
+        ),
+    ]
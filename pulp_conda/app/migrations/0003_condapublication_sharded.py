@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0002_package_index_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="condapublication",
+            name="sharded",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0004_pendingpackage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="condarepository",
+            name="channel",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name="package",
+            unique_together={("name", "version", "build", "extension", "subdir", "_pulp_domain")},
+        ),
+    ]
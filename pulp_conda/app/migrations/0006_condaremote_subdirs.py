@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0005_channel_repository"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="condaremote",
+            name="subdirs",
+            field=models.JSONField(default=list),
+        ),
+    ]
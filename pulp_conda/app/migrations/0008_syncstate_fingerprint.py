@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0007_syncstate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncstate",
+            name="fingerprint",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.AddField(
+            model_name="syncstate",
+            name="mirror",
+            field=models.BooleanField(default=False),
+        ),
+    ]
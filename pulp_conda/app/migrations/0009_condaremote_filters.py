@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0008_syncstate_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="condaremote",
+            name="includes",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="condaremote",
+            name="excludes",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="condaremote",
+            name="latest_n",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
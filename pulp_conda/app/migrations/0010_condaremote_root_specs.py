@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0009_condaremote_filters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="condaremote",
+            name="root_specs",
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,50 @@
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0010_condaremote_root_specs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RepodataCache",
+            fields=[
+                (
+                    "pulp_id",
+                    models.UUIDField(
+                        default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("pulp_created", models.DateTimeField(auto_now_add=True)),
+                ("pulp_last_updated", models.DateTimeField(auto_now=True, null=True)),
+                ("relative_path", models.TextField()),
+                ("etag", models.TextField(default="")),
+                ("last_modified", models.TextField(default="")),
+                ("fetched_at", models.DateTimeField()),
+                ("refresh_started_at", models.DateTimeField(null=True)),
+                (
+                    "remote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="conda.condaremote",
+                    ),
+                ),
+                (
+                    "repodata",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="conda.repodata",
+                    ),
+                ),
+            ],
+            options={
+                "default_related_name": "%(app_label)s_%(model_name)s",
+                "unique_together": {("remote", "relative_path")},
+            },
+        ),
+    ]
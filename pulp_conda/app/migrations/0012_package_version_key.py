@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+from pulp_conda.app.version import version_key
+
+BATCH_SIZE = 1000
+
+
+def set_version_keys(apps, schema_editor):
+    Package = apps.get_model("conda", "Package")
+    batch = []
+    for package in Package.objects.only("pk", "version").iterator(chunk_size=BATCH_SIZE):
+        package.version_key = version_key(package.version)
+        batch.append(package)
+        if len(batch) == BATCH_SIZE:
+            Package.objects.bulk_update(batch, ["version_key"])
+            batch = []
+    Package.objects.bulk_update(batch, ["version_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0011_repodatacache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="package",
+            name="version_key",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(set_version_keys, migrations.RunPython.noop, elidable=True),
+        migrations.AddIndex(
+            model_name="package",
+            index=models.Index(fields=["name", "version_key"], name="conda_package_name_version"),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+from pulp_conda.app.utils import record_fingerprint
+
+BATCH_SIZE = 1000
+
+# The metadata field values of a Package, see `Package.metadata_from_index`.
+METADATA_FIELDS = (
+    "subdir",
+    "build_number",
+    "depends",
+    "constrains",
+    "license",
+    "noarch",
+    "timestamp",
+    "md5",
+    "sha256",
+    "size",
+    "extra_metadata",
+)
+
+
+def set_metadata_digests(apps, schema_editor):
+    Package = apps.get_model("conda", "Package")
+    packages = Package.objects.exclude(sha256="").only("pk", *METADATA_FIELDS)
+    batch = []
+    for package in packages.iterator(chunk_size=BATCH_SIZE):
+        metadata = {field: getattr(package, field) for field in METADATA_FIELDS}
+        package.metadata_digest = record_fingerprint(metadata).hex()
+        batch.append(package)
+        if len(batch) == BATCH_SIZE:
+            Package.objects.bulk_update(batch, ["metadata_digest"])
+            batch = []
+    Package.objects.bulk_update(batch, ["metadata_digest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conda", "0013_shard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="package",
+            name="metadata_digest",
+            field=models.CharField(default="", max_length=32),
+        ),
+        migrations.RunPython(set_metadata_digests, migrations.RunPython.noop, elidable=True),
+        migrations.AlterUniqueTogether(
+            name="package",
+            unique_together={
+                (
+                    "name",
+                    "version",
+                    "build",
+                    "extension",
+                    "subdir",
+                    "metadata_digest",
+                    "_pulp_domain",
+                )
+            },
+        ),
+    ]
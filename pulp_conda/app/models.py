@@ -1,21 +1,47 @@
+import os
+from datetime import timedelta
+from gettext import gettext as _
 from logging import getLogger
 
-from django.db import models
+from aiohttp import web
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from pulpcore.plugin.models import (
+    Artifact,
+    BaseModel,
     Content,
     ContentArtifact,
     Remote,
     Repository,
     Publication,
     Distribution,
+    PublishedArtifact,
+    RemoteArtifact,
 )
+from pulpcore.plugin.repo_version_utils import remove_duplicates
 from pulpcore.plugin.util import get_domain_pk
 
-from .utils import extract_package_info
+from .utils import (
+    extract_package_info,
+    md5_hexdigest,
+    parse_package_filename,
+    read_package_index,
+    record_fingerprint,
+)
+from .version import version_key
 
 logger = getLogger(__name__)
 
+# The metadata files pull-through distributions cache, by basename.
+PULL_THROUGH_REPODATA = ("repodata.json", "current_repodata.json")
+
+# A background refresh of a cached repodata.json which did not finish within this time is
+# considered failed, so another one can start.
+REFRESH_TIMEOUT = timedelta(minutes=10)
+
 
 class Package(Content):
     """
@@ -23,19 +49,72 @@ class Package(Content):
 
     Content of this type represents a single conda package uniquely identified by name, version, build and platform.
 
+    The metadata of the info/index.json of the package is stored alongside, so repodata can be
+    generated without opening the package again.
+
     Fields:
         name (str): The name of the conda package.
         version (str): The version of the conda package.
+        version_key (bytes): The sort key of the version, which orders packages by version in SQL,
+            see `VersionOrder.sort_key`. Null for invalid versions.
         build (str): The build number of the conda package.
         extension (str): The extension of the conda package.
+        subdir (str): The subdir of the conda package, e.g. "noarch" or "linux-64".
+        build_number (int): The build number of the conda package.
+        depends (list): The dependencies of the conda package as match specs.
+        constrains (list): The constraints on optional dependencies as match specs.
+        license (str): The license of the conda package.
+        noarch (str): The noarch type of the conda package, i.e. "python", "generic" or empty.
+        timestamp (int): The build timestamp of the conda package in milliseconds.
+        md5 (str): The MD5 HEX digest of the package file.
+        sha256 (str): The SHA256 HEX digest of the package file.
+        size (int): The size of the package file in bytes.
+        extra_metadata (dict): Any other field of the info/index.json of the conda package.
+        metadata_digest (str): The digest of the metadata, see `digest_metadata`. Channels patch
+            the records of published packages, e.g. to fix their ``depends``, so the same file
+            may be synced with different metadata, as a different Package. Empty for packages
+            created before their metadata was stored.
     """
 
     TYPE = "package"
 
+    # A repository version holds a single package per filename and subdir, the one added last.
+    repo_key_fields = ("name", "version", "build", "extension", "subdir")
+
+    # Fields of info/index.json that are stored in a dedicated column.
+    INDEX_FIELDS = (
+        "name",
+        "version",
+        "build",
+        "subdir",
+        "build_number",
+        "depends",
+        "constrains",
+        "license",
+        "noarch",
+        "timestamp",
+        "md5",
+        "sha256",
+        "size",
+    )
+
     name = models.CharField(max_length=255)
     version = models.CharField(max_length=255)
+    version_key = models.BinaryField(null=True)
     build = models.CharField(max_length=255)
     extension = models.CharField(max_length=8)
+    subdir = models.CharField(max_length=64, default="")
+    build_number = models.PositiveIntegerField(default=0)
+    depends = models.JSONField(default=list)
+    constrains = models.JSONField(default=list)
+    license = models.TextField(default="")
+    noarch = models.CharField(max_length=16, default="")
+    timestamp = models.BigIntegerField(null=True)
+    md5 = models.CharField(max_length=32, default="")
+    sha256 = models.CharField(max_length=64, default="", db_index=True)
+    size = models.BigIntegerField(null=True)
+    extra_metadata = models.JSONField(default=dict)
+    metadata_digest = models.CharField(max_length=32, default="")
     _pulp_domain = models.ForeignKey("core.Domain", default=get_domain_pk, on_delete=models.PROTECT)
 
     @property
@@ -45,15 +124,202 @@ class Package(Content):
         """
         return f"{self.name}-{self.version}-{self.build}.{self.extension}"
 
+    @property
+    def has_metadata(self):
+        """
+        Whether the info/index.json metadata of the package has been stored.
+        """
+        return bool(self.sha256)
+
+    @staticmethod
+    def metadata_from_index(index):
+        """
+        Converts an info/index.json or repodata.json record into field values of a Package.
+
+        Args:
+            index (dict): The info/index.json or repodata.json record of the package.
+
+        Returns:
+            dict: The metadata field values, i.e. everything but the name, version and build.
+        """
+        noarch = index.get("noarch") or ""
+        if noarch is True:
+            # Old packages mark generic noarch packages with a boolean.
+            noarch = "generic"
+        timestamp = index.get("timestamp")
+
+        return {
+            "subdir": index.get("subdir") or "",
+            "build_number": int(index.get("build_number") or 0),
+            "depends": list(index.get("depends") or []),
+            "constrains": list(index.get("constrains") or []),
+            "license": index.get("license") or "",
+            "noarch": noarch,
+            "timestamp": int(timestamp) if timestamp is not None else None,
+            "md5": index.get("md5") or "",
+            "sha256": index.get("sha256") or "",
+            "size": index.get("size"),
+            "extra_metadata": {
+                key: value for key, value in index.items() if key not in Package.INDEX_FIELDS
+            },
+        }
+
+    @staticmethod
+    def digest_metadata(metadata):
+        """
+        Returns the digest of metadata field values, see `metadata_from_index`.
+        """
+        return record_fingerprint(metadata).hex()
+
+    @staticmethod
+    def metadata_from_artifact(artifact, extension):
+        """
+        Reads the metadata field values of a Package from its artifact.
+
+        Args:
+            artifact (pulpcore.plugin.models.Artifact): The saved artifact of the package.
+            extension (str): The extension of the package, i.e. "conda" or "tar.bz2".
+
+        Returns:
+            dict: The metadata field values, see `metadata_from_index`.
+        """
+        with artifact.file.open("rb") as fileobj:
+            return Package.metadata_from_file(fileobj, extension, artifact)
+
+    @staticmethod
+    def metadata_from_file(fileobj, extension, artifact, md5=None):
+        """
+        Reads the metadata field values of a Package from a local copy of its artifact.
+
+        Args:
+            fileobj: A binary file object containing the package.
+            extension (str): The extension of the package, i.e. "conda" or "tar.bz2".
+            artifact (pulpcore.plugin.models.Artifact): The artifact of the package, which
+                provides the digests and the size.
+            md5 (str): The md5 hex digest of the package, if already known. Otherwise, it is
+                computed from the file unless the artifact has one.
+
+        Returns:
+            dict: The metadata field values, see `metadata_from_index`.
+        """
+        index = read_package_index(fileobj, extension)
+        md5 = md5 or artifact.md5 or md5_hexdigest(fileobj)
+
+        index.update(md5=md5, sha256=artifact.sha256, size=artifact.size)
+        return Package.metadata_from_index(index)
+
+    def to_record(self):
+        """
+        Returns the repodata.json record of the package.
+        """
+        record = dict(self.extra_metadata)
+        record.update(
+            name=self.name,
+            version=self.version,
+            build=self.build,
+            build_number=self.build_number,
+            depends=self.depends,
+            md5=self.md5,
+            sha256=self.sha256,
+            subdir=self.subdir,
+        )
+        if self.constrains:
+            record["constrains"] = self.constrains
+        if self.license:
+            record["license"] = self.license
+        if self.noarch:
+            record["noarch"] = self.noarch
+        if self.timestamp is not None:
+            record["timestamp"] = self.timestamp
+        if self.size is not None:
+            record["size"] = self.size
+        return record
+
     @staticmethod
     def init_from_artifact_and_relative_path(artifact, relative_path):
         name, version, build, extension = extract_package_info(relative_path)
 
-        return Package(name=name, version=version, build=build, extension=extension)
+        return Package(
+            name=name,
+            version=version,
+            version_key=version_key(version),
+            build=build,
+            extension=extension,
+            **Package.metadata_from_artifact(artifact, extension),
+        )
+
+    @staticmethod
+    def get_or_create_from_artifact(relative_path, artifact, metadata):
+        """
+        Returns the Package of an uploaded artifact, creating it if it does not exist yet.
+
+        Args:
+            relative_path (str): The filename of the package.
+            artifact (pulpcore.plugin.models.Artifact): The saved artifact of the package.
+            metadata (dict): The metadata field values, see `metadata_from_file`.
+
+        Raises:
+            ValueError: If a different file with the same filename and subdir exists already.
+        """
+        name, version, build, extension = extract_package_info(relative_path)
+        conflicting = (
+            Package.objects.filter(
+                name=name,
+                version=version,
+                build=build,
+                extension=extension,
+                subdir=metadata.get("subdir", ""),
+                _pulp_domain_id=artifact.pulp_domain_id,
+            )
+            .exclude(sha256="")
+            .exclude(sha256=artifact.sha256)
+        )
+        if conflicting.exists():
+            raise ValueError(
+                _("The package {} already exists with a different digest.").format(relative_path)
+            )
+        try:
+            with transaction.atomic():
+                package = Package.objects.create(
+                    name=name,
+                    version=version,
+                    version_key=version_key(version),
+                    build=build,
+                    extension=extension,
+                    metadata_digest=Package.digest_metadata(metadata),
+                    _pulp_domain_id=artifact.pulp_domain_id,
+                    **metadata,
+                )
+                ContentArtifact.objects.create(
+                    content=package, artifact=artifact, relative_path=package.relative_path
+                )
+        except IntegrityError:
+            package = Package.objects.get(
+                name=name,
+                version=version,
+                build=build,
+                extension=extension,
+                subdir=metadata.get("subdir", ""),
+                metadata_digest=Package.digest_metadata(metadata),
+                _pulp_domain_id=artifact.pulp_domain_id,
+            )
+        return package
 
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
-        unique_together = ("name", "version", "build", "extension", "_pulp_domain")
+        unique_together = (
+            "name",
+            "version",
+            "build",
+            "extension",
+            "subdir",
+            "metadata_digest",
+            "_pulp_domain",
+        )
+        indexes = [
+            models.Index(fields=["name", "subdir"], name="conda_package_name_subdir"),
+            models.Index(fields=["name", "version_key"], name="conda_package_name_version"),
+        ]
 
 class Repodata(Content):
     """
@@ -87,28 +353,64 @@ class CondaPublication(Publication):
     """
     A Publication for CondaContent.
 
-    Define any additional fields for your new publication if needed.
+    Fields:
+        sharded (bool): Whether the publication contains sharded repodata as specified by CEP-16.
     """
 
     TYPE = "conda"
 
+    sharded = models.BooleanField(default=False)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+
+
+class Shard(BaseModel):
+    """
+    A compressed shard of sharded repodata, see `pulp_conda.app.shards`.
+
+    Publications reuse the artifact of a shard with the same content instead of compressing it
+    again.
+
+    Fields:
+        fingerprint (str): The SHA256 HEX digest of the compression level and the uncompressed
+            shard.
+        artifact (pulpcore.plugin.models.Artifact): The compressed shard.
+    """
+
+    fingerprint = models.CharField(max_length=64)
+    artifact = models.ForeignKey(Artifact, on_delete=models.CASCADE)
+    _pulp_domain = models.ForeignKey("core.Domain", default=get_domain_pk, on_delete=models.PROTECT)
+
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
+        unique_together = ("fingerprint", "_pulp_domain")
 
 
 class CondaRemote(Remote):
     """
     A Remote for CondaContent.
 
-    Define any additional fields for your new remote if needed.
+    Fields:
+        subdirs (list): The subdirs to sync, e.g. ["noarch", "linux-64"]. If set, the url points
+            to the channel instead of a single subdir, and all subdirs are synced concurrently.
+        includes (list): Match specs of the packages to sync. If empty, all packages are synced.
+        excludes (list): Match specs of the packages not to sync.
+        latest_n (int): If set, only the latest N versions of every package name are synced.
+        root_specs (list): If set, only the packages matching these match specs and their
+            transitive dependencies are synced.
     """
 
     TYPE = "conda"
 
-    def get_remote_artifact_content_type(self, relative_path=None):
-        name, version, build, extension = extract_package_info(relative_path)
+    subdirs = models.JSONField(default=list)
+    includes = models.JSONField(default=list)
+    excludes = models.JSONField(default=list)
+    latest_n = models.PositiveIntegerField(null=True)
+    root_specs = models.JSONField(default=list)
 
-        if None in [name, version, build, extension]:
+    def get_remote_artifact_content_type(self, relative_path=None):
+        if parse_package_filename(relative_path) is None:
             return None
 
         return Package
@@ -117,20 +419,81 @@ class CondaRemote(Remote):
         default_related_name = "%(app_label)s_%(model_name)s"
 
 
+class SyncState(BaseModel):
+    """
+    The state of the repodata.json of a remote subdir as of the last sync into a repository.
+
+    Fields:
+        remote (CondaRemote): The remote that was synced.
+        repository (CondaRepository): The repository that was synced into.
+        subdir (str): The subdir of the remote, empty if the remote url points to a subdir.
+        etag (str): The ETag header of the repodata.json.
+        last_modified (str): The Last-Modified header of the repodata.json.
+        sha256 (str): The SHA256 hex digest of the repodata.json.
+        fingerprint (bytes): The digest of every package filename of the repodata.json, see
+            `pulp_conda.app.utils.encode_fingerprint`.
+        mirror (bool): Whether the sync was in mirror mode.
+        version (int): The number of the repository version the sync resulted in.
+    """
+
+    remote = models.ForeignKey(CondaRemote, on_delete=models.CASCADE)
+    repository = models.ForeignKey("CondaRepository", on_delete=models.CASCADE)
+    subdir = models.CharField(max_length=64, default="")
+    etag = models.TextField(default="")
+    last_modified = models.TextField(default="")
+    sha256 = models.CharField(max_length=64, default="")
+    fingerprint = models.BinaryField(default=b"")
+    mirror = models.BooleanField(default=False)
+    version = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+        unique_together = ("remote", "repository", "subdir")
+
+
 class CondaRepository(Repository):
     """
     A Repository for CondaContent.
 
-    Define any additional fields for your new repository if needed.
+    Fields:
+        channel (bool): Whether the repository holds a whole channel, i.e. the packages of all
+            subdirs. Its publications contain a ``<subdir>/repodata.json`` for every subdir and a
+            ``channeldata.json``, and serve the packages as ``<subdir>/<filename>``.
     """
 
     TYPE = "conda"
 
+    channel = models.BooleanField(default=False)
+
     CONTENT_TYPES = [Package, Repodata]
     REMOTE_TYPES = [CondaRemote]
 
     PULL_THROUGH_SUPPORTED = True
 
+    def finalize_new_version(self, new_version):
+        """
+        Keeps a single package per filename and subdir and a single repodata.json per path in a
+        new repository version, the one added last.
+
+        A sync adds a new Package for a package whose upstream record was patched, see
+        `Package.metadata_digest`, and the upstream repodata.json of each subdir. An additive or
+        incremental sync does not remove the ones of the previous sync, so they are removed here.
+
+        Args:
+            new_version (pulpcore.app.models.RepositoryVersion): The incomplete version.
+        """
+        remove_duplicates(new_version)
+
+        added = Repodata.objects.filter(pk__in=new_version.added())
+        paths = ContentArtifact.objects.filter(content__in=added).values("relative_path")
+        replaced = ContentArtifact.objects.filter(
+            content__in=Repodata.objects.filter(pk__in=new_version.content).exclude(
+                pk__in=added
+            ),
+            relative_path__in=paths,
+        ).values("content")
+        new_version.remove_content(Repodata.objects.filter(pk__in=replaced))
+
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
 
@@ -139,10 +502,365 @@ class CondaDistribution(Distribution):
     """
     A Distribution for CondaContent.
 
-    Define any additional fields for your new distribution if needed.
+    A pull-through distribution, i.e. one with a remote but without a publication, caches the
+    repodata.json files of the remote, see `content_handler`. Packages missing from the artifact
+    storage are downloaded once, however many clients request them concurrently.
     """
 
     TYPE = "conda"
 
+    def content_handler(self, path):
+        """
+        Serves published metadata files from cache and the files of the remote, which are not in
+        the artifact storage.
+
+        A published repodata.json is served in the stored encoding the client accepts. With
+        ``CONDA_METADATA_CACHE_SIZE`` set, the metadata files of the served publication are held in
+        memory, see `pulp_conda.app.content.MetadataCache`.
+
+        The repodata.json files of the remote of a pull-through distribution are served from cache,
+        see `_repodata_response`. A package without an artifact, i.e. one of a repository synced
+        on demand or one not fetched through the pull-through distribution yet, is downloaded once
+        for all concurrent requests, stored, and streamed to them while it is downloaded. Packages
+        in the artifact storage are left to pulpcore.
+
+        Args:
+            path (str): The path of the request relative to the base path of the distribution.
+
+        Returns:
+            None if pulpcore serves the path, otherwise the response.
+        """
+        from .content import CACHED_METADATA
+
+        basename = os.path.basename(path)
+        if basename in PULL_THROUGH_REPODATA or (
+            settings.CONDA_METADATA_CACHE_SIZE and basename in CACHED_METADATA
+        ):
+            response = self._published_metadata_response(path)
+            if response is not None:
+                return response
+
+        if basename in PULL_THROUGH_REPODATA:
+            if self.remote_id is None or self.publication_id is not None:
+                return None
+            return self._repodata_response(path)
+
+        if parse_package_filename(path) is None:
+            return None
+
+        from .content import FlightResponse, fetch_remote_package
+
+        remote_artifact = self._on_demand_remote_artifact(path)
+        if remote_artifact is not None:
+            content_artifact = remote_artifact.content_artifact
+            remote, url = remote_artifact.remote.cast(), remote_artifact.url
+        elif self.remote_id is not None:
+            remote = self.remote.cast()
+            url = remote.get_remote_artifact_url(path)
+            # A package fetched before is linked to the remote and url. Once its artifact is
+            # stored, pulpcore serves it.
+            remote_artifact = (
+                RemoteArtifact.objects.filter(remote=remote, url=url)
+                .select_related("content_artifact")
+                .first()
+            )
+            if remote_artifact is not None:
+                content_artifact = remote_artifact.content_artifact
+                if content_artifact.artifact_id is not None:
+                    return None
+        else:
+            return None
+
+        if not url.startswith(("http://", "https://")):
+            return None
+        return FlightResponse(
+            fetch_remote_package(remote, url, path, content_artifact),
+            content_type="application/octet-stream",
+        )
+
+    def _served_publication(self):
+        """
+        Returns the publication the distribution serves, if any.
+        """
+        if self.publication_id is not None:
+            return self.publication
+        if self.repository_version_id is not None:
+            version = self.repository_version
+        elif self.repository_id is not None:
+            version = self.repository.latest_version()
+        else:
+            return None
+        return (
+            Publication.objects.filter(repository_version=version, complete=True)
+            .order_by("-pulp_created")
+            .first()
+        )
+
+    def _published_metadata_response(self, path):
+        """
+        Serves a published metadata file, negotiating its Content-Encoding and from cache.
+
+        For a repodata.json or current_repodata.json, the published variant of the first encoding
+        the client accepts is served with a Content-Encoding header, see
+        `pulp_conda.app.content.ENCODINGS`. Nothing is compressed on the fly. Variants are only
+        served from cache or from a local file, any other file is left to pulpcore.
+
+        Returns:
+            None if pulpcore serves the file.
+        """
+        from .content import (
+            CACHED_METADATA,
+            ENCODINGS,
+            NegotiatedResponse,
+            artifact_path,
+            metadata_cache,
+        )
+
+        publication = self._served_publication()
+        if publication is None:
+            return None
+        basename = os.path.basename(path)
+        cached = settings.CONDA_METADATA_CACHE_SIZE and basename in CACHED_METADATA
+        if cached:
+            metadata_cache.serve(self.pk, publication.pk)
+
+        negotiated = basename in PULL_THROUGH_REPODATA
+        candidates = {None: path}
+        if negotiated:
+            candidates.update(
+                (encoding, f"{path}{suffix}") for encoding, suffix in ENCODINGS.items()
+            )
+
+        variants = {}
+        missing = {}
+        for encoding, relative_path in candidates.items():
+            entry = metadata_cache.get(publication.pk, relative_path) if cached else None
+            if entry is not None:
+                variants[encoding] = entry
+            else:
+                missing[relative_path] = encoding
+        if missing:
+            published_artifacts = PublishedArtifact.objects.filter(
+                publication=publication, relative_path__in=missing
+            ).select_related("content_artifact__artifact")
+            for published_artifact in published_artifacts:
+                artifact = published_artifact.content_artifact.artifact
+                if artifact is None:
+                    continue
+                encoding = missing[published_artifact.relative_path]
+                etag = f'"{artifact.sha256}"'
+                if cached and artifact.size <= settings.CONDA_METADATA_CACHE_SIZE:
+                    with artifact.file.open("rb") as fileobj:
+                        body = fileobj.read()
+                    metadata_cache.put(publication.pk, published_artifact.relative_path, body, etag)
+                    variants[encoding] = (body, etag)
+                elif negotiated:
+                    local_path = artifact_path(artifact)
+                    if local_path is not None:
+                        variants[encoding] = (local_path, etag)
+
+        if None not in variants:
+            return None
+        if path.endswith(".json"):
+            content_type = "application/json"
+        else:
+            content_type = "application/octet-stream"
+        return NegotiatedResponse(variants, vary=negotiated, content_type=content_type)
+
+    def _on_demand_remote_artifact(self, path):
+        """
+        Returns the remote artifact of the content without artifact the distribution serves at
+        the path, if any.
+
+        The remote artifact names the remote the content was synced from, which need not be the
+        current remote of the repository. Content without remote artifacts, e.g. that of a
+        repository synced immediately, is never matched, and the request is left to pulpcore.
+        """
+        if self.publication_id is not None:
+            version = self.publication.repository_version
+        elif self.repository_version_id is not None:
+            version = self.repository_version
+        elif self.repository_id is not None:
+            version = self.repository.latest_version()
+        else:
+            return None
+
+        remote_artifacts = (
+            RemoteArtifact.objects.filter(content_artifact__artifact__isnull=True)
+            .select_related("content_artifact", "remote")
+            .order_by("pk")
+        )
+        if self.publication_id is not None:
+            published_artifacts = PublishedArtifact.objects.filter(
+                publication=self.publication, relative_path=path
+            )
+            if published_artifacts.exists():
+                return remote_artifacts.filter(
+                    content_artifact__in=published_artifacts.values("content_artifact")
+                ).first()
+            if not self.publication.pass_through:
+                return None
+        return remote_artifacts.filter(
+            content_artifact__content__in=version.content,
+            content_artifact__relative_path=path,
+        ).first()
+
+    def _repodata_response(self, path):
+        """
+        Serves a repodata.json of the remote of a pull-through distribution from cache.
+
+        A fresh cache entry is served as is. A stale one is served while a single background
+        task refreshes it. Without a usable cache entry, the file is fetched from the remote,
+        cached and served.
+        """
+        from .content import FlightResponse, fetch_remote_repodata
+
+        remote = self.remote.cast()
+        cache = (
+            RepodataCache.objects.filter(remote=remote, relative_path=path)
+            .select_related("repodata")
+            .first()
+        )
+        if cache is not None:
+            age = (timezone.now() - cache.fetched_at).total_seconds()
+            ttl = settings.CONDA_PULL_THROUGH_REPODATA_TTL
+            if age <= ttl + settings.CONDA_PULL_THROUGH_REPODATA_STALE_TTL:
+                # The cached file is gone if orphan cleanup removed it, then it is fetched again.
+                response = cache.response()
+                if response is not None:
+                    if age > ttl:
+                        cache.refresh()
+                    return response
+
+        return FlightResponse(fetch_remote_repodata(remote, path), content_type="application/json")
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+
+
+class PendingPackage(BaseModel):
+    """
+    A package waiting to be added to a repository by a coalescing ``publish_package`` task.
+
+    Fields:
+        repository (CondaRepository): The repository the package is added to.
+        package (Package): The package to add.
+    """
+
+    repository = models.ForeignKey(CondaRepository, on_delete=models.CASCADE)
+    package = models.ForeignKey(Package, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+        unique_together = ("repository", "package")
+
+
+class RepodataCache(BaseModel):
+    """
+    A repodata.json of a remote cached by pull-through distributions.
+
+    Fields:
+        remote (CondaRemote): The remote the file is fetched from.
+        relative_path (str): The path of the file relative to the remote url.
+        repodata (Repodata): The content holding the cached file.
+        etag (str): The ETag header of the cached file.
+        last_modified (str): The Last-Modified header of the cached file.
+        fetched_at (datetime): When the file was last fetched or found unmodified.
+        refresh_started_at (datetime): When the running background refresh started, if any.
+    """
+
+    remote = models.ForeignKey(CondaRemote, on_delete=models.CASCADE)
+    relative_path = models.TextField()
+    repodata = models.ForeignKey(Repodata, on_delete=models.CASCADE)
+    etag = models.TextField(default="")
+    last_modified = models.TextField(default="")
+    fetched_at = models.DateTimeField()
+    refresh_started_at = models.DateTimeField(null=True)
+
+    def response(self):
+        """
+        Returns the response serving the cached file.
+
+        The cached Repodata is not in any repository version, so orphan cleanup may remove it
+        along with its artifact. Returns None then.
+        """
+        artifact = self.repodata._artifacts.first()
+        if artifact is None:
+            return None
+        try:
+            path = artifact.file.path
+        except NotImplementedError:
+            # Storages without local files serve the artifact themselves.
+            return web.HTTPFound(artifact.file.url)
+        if not os.path.exists(path):
+            return None
+        return web.FileResponse(path, headers={"Content-Type": "application/json"})
+
+    def refresh(self):
+        """
+        Dispatches a background refresh, unless one is running already.
+        """
+        now = timezone.now()
+        started = RepodataCache.objects.filter(
+            Q(refresh_started_at__isnull=True) | Q(refresh_started_at__lt=now - REFRESH_TIMEOUT),
+            pk=self.pk,
+        ).update(refresh_started_at=now)
+        if started:
+            from pulpcore.plugin.tasking import dispatch
+
+            from .tasks import refresh_repodata_cache
+
+            dispatch(
+                refresh_repodata_cache,
+                kwargs={"remote_pk": str(self.remote_id), "relative_path": self.relative_path},
+                exclusive_resources=[f"conda-repodata-cache:{self.remote_id}:{self.relative_path}"],
+            )
+
+    @staticmethod
+    def store(remote, relative_path, result):
+        """
+        Stores a downloaded repodata.json as Repodata content and caches it.
+
+        Args:
+            remote (CondaRemote): The remote the file was fetched from.
+            relative_path (str): The path of the file relative to the remote url.
+            result (pulpcore.plugin.download.DownloadResult): The result of the download.
+
+        Returns:
+            RepodataCache: The updated cache entry.
+        """
+        digest = result.artifact_attributes["sha256"]
+        artifact = Artifact(
+            **result.artifact_attributes, file=result.path, pulp_domain=remote.pulp_domain
+        )
+        try:
+            with transaction.atomic():
+                artifact.save()
+        except IntegrityError:
+            artifact = Artifact.objects.get(sha256=digest, pulp_domain=remote.pulp_domain)
+
+        try:
+            with transaction.atomic():
+                repodata = Repodata.objects.create(digest=digest, _pulp_domain=remote.pulp_domain)
+                ContentArtifact.objects.create(
+                    content=repodata, artifact=artifact, relative_path=repodata.relative_path
+                )
+        except IntegrityError:
+            repodata = Repodata.objects.get(digest=digest, _pulp_domain=remote.pulp_domain)
+
+        cache, _created = RepodataCache.objects.update_or_create(
+            remote=remote,
+            relative_path=relative_path,
+            defaults={
+                "repodata": repodata,
+                "etag": result.headers.get("ETag", "") if result.headers else "",
+                "last_modified": result.headers.get("Last-Modified", "") if result.headers else "",
+                "fetched_at": timezone.now(),
+                "refresh_started_at": None,
+            },
+        )
+        return cache
+
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
+        unique_together = ("remote", "relative_path")
@@ -6,6 +6,7 @@ from pulpcore.plugin import models as core_models
 from pulpcore.plugin.util import get_domain_pk
 
 from . import models
+from .match_spec import InvalidMatchSpec, MatchSpec
 
 
 class PackageSerializer(core_serializers.SingleArtifactContentUploadSerializer):
@@ -18,6 +19,16 @@ class PackageSerializer(core_serializers.SingleArtifactContentUploadSerializer):
     build = serializers.CharField()
     extension = serializers.CharField()
     relative_path = serializers.CharField()
+    subdir = serializers.CharField(read_only=True)
+    build_number = serializers.IntegerField(read_only=True)
+    depends = serializers.ListField(child=serializers.CharField(), read_only=True)
+    constrains = serializers.ListField(child=serializers.CharField(), read_only=True)
+    license = serializers.CharField(read_only=True)
+    noarch = serializers.CharField(read_only=True)
+    timestamp = serializers.IntegerField(read_only=True)
+    md5 = serializers.CharField(read_only=True)
+    sha256 = serializers.CharField(read_only=True)
+    size = serializers.IntegerField(read_only=True)
 
     class Meta:
         fields = core_serializers.SingleArtifactContentUploadSerializer.Meta.fields + (
@@ -26,9 +37,101 @@ class PackageSerializer(core_serializers.SingleArtifactContentUploadSerializer):
             "build",
             "extension",
             "relative_path",
+            "subdir",
+            "build_number",
+            "depends",
+            "constrains",
+            "license",
+            "noarch",
+            "timestamp",
+            "md5",
+            "sha256",
+            "size",
         )
         model = models.Package
 
+class PackageBatchUploadSerializer(serializers.Serializer):
+    """
+    A serializer for uploading many conda packages at once.
+    """
+
+    files = serializers.ListField(
+        child=serializers.FileField(),
+        required=False,
+        help_text=_("The conda packages to upload."),
+    )
+    archive = serializers.FileField(
+        required=False,
+        help_text=_(
+            "A tar archive, optionally compressed, containing the conda packages to upload."
+        ),
+    )
+    repository = serializers.CharField(
+        help_text=_("The name of the repository the packages are added to."),
+    )
+
+    def validate(self, data):
+        data = super().validate(data)
+        if not data.get("files") and not data.get("archive"):
+            raise serializers.ValidationError(_("Either 'files' or 'archive' must be provided."))
+        return data
+
+
+class PackageChunkedUploadSerializer(serializers.Serializer):
+    """
+    A serializer for creating a conda package from a completed chunked upload.
+    """
+
+    upload = serializers.CharField(
+        help_text=_("The href of an upload whose chunks contain the conda package."),
+    )
+    filename = serializers.CharField(
+        help_text=_("The filename of the conda package, e.g. 'numpy-1.26.4-py312h0_0.conda'."),
+    )
+    repository = serializers.CharField(
+        help_text=_("The name of the repository the package is added to."),
+    )
+
+
+class PackageNegotiateSerializer(serializers.Serializer):
+    """
+    A serializer for checking whether an upload of a conda package can be skipped.
+    """
+
+    name = serializers.CharField()
+    version = serializers.CharField()
+    build = serializers.CharField()
+    extension = serializers.ChoiceField(choices=["conda", "tar.bz2"])
+    sha256 = serializers.RegexField(
+        r"^[0-9a-f]{64}$", help_text=_("The SHA256 hex digest of the package.")
+    )
+    size = serializers.IntegerField(min_value=0, help_text=_("The size of the package in bytes."))
+    repository = serializers.CharField(
+        required=False,
+        help_text=_(
+            "The name of a repository. If Pulp already has the package, it is added to this "
+            "repository without uploading it."
+        ),
+    )
+
+
+class PackageNegotiateResponseSerializer(serializers.Serializer):
+    """
+    A serializer for the result of a package upload negotiation.
+    """
+
+    artifact_exists = serializers.BooleanField(
+        help_text=_("Whether Pulp already has an artifact with this digest and size.")
+    )
+    package = serializers.CharField(
+        allow_null=True, help_text=_("The href of the existing package, if any.")
+    )
+    task = serializers.CharField(
+        allow_null=True,
+        help_text=_("The href of the task adding the package to the repository, if any."),
+    )
+
+
 class RepodataSerializer(core_serializers.SingleArtifactContentUploadSerializer):
     """
     A serializer for Repodata.
@@ -71,8 +174,70 @@ class CondaRemoteSerializer(core_serializers.RemoteSerializer):
     )
     """
 
+    subdirs = serializers.ListField(
+        child=serializers.RegexField(r"^[a-z0-9_-]+$"),
+        default=list,
+        help_text=_(
+            "The subdirs to sync, e.g. ['noarch', 'linux-64']. If set, the url points to the "
+            "channel and all subdirs are synced concurrently. Otherwise, the url points to a "
+            "single subdir."
+        ),
+    )
+
+    includes = serializers.ListField(
+        child=serializers.CharField(),
+        default=list,
+        help_text=_(
+            "Match specs of the packages to sync, e.g. ['numpy >=1.26', 'python 3.12.*']. If "
+            "empty, all packages are synced."
+        ),
+    )
+    excludes = serializers.ListField(
+        child=serializers.CharField(),
+        default=list,
+        help_text=_("Match specs of the packages not to sync."),
+    )
+    latest_n = serializers.IntegerField(
+        min_value=1,
+        allow_null=True,
+        default=None,
+        help_text=_("If set, only the latest N versions of every package name are synced."),
+    )
+
+    root_specs = serializers.ListField(
+        child=serializers.CharField(),
+        default=list,
+        help_text=_(
+            "Match specs like ['python=3.11', 'numpy']. If set, only the packages matching them "
+            "and their transitive dependencies are synced."
+        ),
+    )
+
+    def _validate_match_specs(self, value):
+        for spec in value:
+            try:
+                MatchSpec(spec)
+            except InvalidMatchSpec as exc:
+                raise serializers.ValidationError(str(exc))
+        return value
+
+    def validate_includes(self, value):
+        return self._validate_match_specs(value)
+
+    def validate_excludes(self, value):
+        return self._validate_match_specs(value)
+
+    def validate_root_specs(self, value):
+        return self._validate_match_specs(value)
+
     class Meta:
-        fields = core_serializers.RemoteSerializer.Meta.fields
+        fields = core_serializers.RemoteSerializer.Meta.fields + (
+            "subdirs",
+            "includes",
+            "excludes",
+            "latest_n",
+            "root_specs",
+        )
         model = models.CondaRemote
 
 
@@ -90,8 +255,17 @@ class CondaRepositorySerializer(core_serializers.RepositorySerializer):
         validators = platform.RepositorySerializer.Meta.validators + [myValidator1, myValidator2]
     """
 
+    channel = serializers.BooleanField(
+        default=False,
+        help_text=_(
+            "Whether the repository holds the packages of all subdirs of a channel. Its "
+            "publications contain a '<subdir>/repodata.json' for every subdir and a "
+            "'channeldata.json'."
+        ),
+    )
+
     class Meta:
-        fields = core_serializers.RepositorySerializer.Meta.fields
+        fields = core_serializers.RepositorySerializer.Meta.fields + ("channel",)
         model = models.CondaRepository
 
 
@@ -109,8 +283,16 @@ class CondaPublicationSerializer(core_serializers.PublicationSerializer):
         validators = platform.PublicationSerializer.Meta.validators + [myValidator1, myValidator2]
     """
 
+    sharded = serializers.BooleanField(
+        help_text=_(
+            "Whether to also publish sharded repodata (CEP-16), i.e. repodata_shards.msgpack.zst "
+            "and one shard per package name."
+        ),
+        default=False,
+    )
+
     class Meta:
-        fields = core_serializers.PublicationSerializer.Meta.fields
+        fields = core_serializers.PublicationSerializer.Meta.fields + ("sharded",)
         model = models.CondaPublication
 
 
@@ -4,3 +4,30 @@ Check `Plugin Writer's Guide`_ for more details.
 .. _Plugin Writer's Guide:
     https://pulpproject.org/pulpcore/docs/dev/
 """
+
+# Compression levels of the repodata.json.zst, repodata.json.bz2 and repodata.json.gz variants
+# written on publish.
+CONDA_REPODATA_ZSTD_LEVEL = 16
+CONDA_REPODATA_BZ2_LEVEL = 9
+CONDA_REPODATA_GZIP_LEVEL = 9
+
+# Maximum size of the published repodata.jlap in bytes. The oldest patches are dropped beyond it.
+CONDA_JLAP_MAX_SIZE = 10 * 1024 * 1024
+
+# Number of threads hashing and storing the packages of a batch upload in parallel.
+CONDA_UPLOAD_WORKERS = 4
+
+# Whether concurrent uploads to the same repository are added in as few repository versions as
+# possible. The first queued task adds all pending packages, the others have nothing left to do.
+CONDA_COALESCE_UPLOADS = False
+
+# Seconds a repodata.json cached by a pull-through distribution is served without a refresh.
+CONDA_PULL_THROUGH_REPODATA_TTL = 300
+
+# Seconds after its TTL a cached repodata.json is still served while one background task
+# refreshes it. Older entries are fetched again before they are served.
+CONDA_PULL_THROUGH_REPODATA_STALE_TTL = 24 * 60 * 60
+
+# Maximum total size in bytes of the published metadata files, e.g. repodata.json, each content app
+# process holds in memory. 0 disables the cache.
+CONDA_METADATA_CACHE_SIZE = 0
@@ -0,0 +1,97 @@
+"""
+Support for sharded repodata as specified by CEP-16.
+
+The shards index ``repodata_shards.msgpack.zst`` maps every package name to the SHA256 digest of
+its shard. A shard holds the records of all packages with that name and is stored, content
+addressed, as ``shards/<sha256>.msgpack.zst``. All files are msgpack documents compressed with
+zstd.
+"""
+import msgpack
+import zstandard
+
+SHARDS_INDEX = "repodata_shards.msgpack.zst"
+SHARDS_BASE_URL = "shards/"
+
+
+def shard_relative_path(digest):
+    """
+    Returns the relative path of a shard.
+
+    Args:
+        digest (bytes): The SHA256 digest of the shard.
+    """
+    return f"{SHARDS_BASE_URL}{digest.hex()}.msgpack.zst"
+
+
+def _shard_record(record):
+    # Shards store the digests as raw bytes instead of hex strings to save space.
+    record = {key: record[key] for key in sorted(record)}
+    for key in ("md5", "sha256"):
+        if record.get(key):
+            record[key] = bytes.fromhex(record[key])
+    return record
+
+
+def pack_shard(packages, conda_packages):
+    """
+    Returns the uncompressed shard of a single package name.
+
+    The output only depends on the records, so an unchanged shard always has the same digest.
+
+    Args:
+        packages: An iterable of ``(filename, record)`` tuples of ".tar.bz2" packages.
+        conda_packages: An iterable of ``(filename, record)`` tuples of ".conda" packages.
+    """
+    shard = {
+        "packages": {filename: _shard_record(record) for filename, record in packages},
+        "packages.conda": {
+            filename: _shard_record(record) for filename, record in conda_packages
+        },
+        "removed": [],
+    }
+    return msgpack.packb(shard, use_bin_type=True)
+
+
+def write_shard(fileobj, data, level):
+    """
+    Writes a shard.
+
+    Args:
+        fileobj: A binary file object to write the shard to.
+        data (bytes): The uncompressed shard, see `pack_shard`.
+        level (int): The zstd compression level.
+    """
+    fileobj.write(zstandard.ZstdCompressor(level=level).compress(data))
+
+
+def write_shards_index(fileobj, subdir, shards, level):
+    """
+    Writes the shards index.
+
+    Args:
+        fileobj: A binary file object to write the index to.
+        subdir (str): The subdir the packages belong to.
+        shards (dict): The SHA256 digest of the shard of every package name.
+        level (int): The zstd compression level.
+    """
+    index = {
+        "version": 1,
+        "info": {"base_url": "", "shards_base_url": SHARDS_BASE_URL, "subdir": subdir},
+        "shards": {name: shards[name] for name in sorted(shards)},
+    }
+    data = msgpack.packb(index, use_bin_type=True)
+    fileobj.write(zstandard.ZstdCompressor(level=level).compress(data))
+
+
+def read_shards_index(fileobj):
+    """
+    Reads the shards of a shards index.
+
+    Args:
+        fileobj: A binary file object containing the shards index.
+
+    Returns:
+        dict: The SHA256 digest of the shard of every package name.
+    """
+    with zstandard.ZstdDecompressor().stream_reader(fileobj) as reader:
+        return msgpack.unpackb(reader.read(), raw=False)["shards"]
@@ -1,2 +1,4 @@
-from .publishing import publish_package, publish_repodata  # noqa
+from .caching import refresh_repodata_cache  # noqa
+from .publishing import add_packages, publish, publish_package, publish_repodata  # noqa
 from .synchronizing import synchronize  # noqa
+from .uploading import upload_package  # noqa
@@ -0,0 +1,46 @@
+from gettext import gettext as _
+import asyncio
+import logging
+
+from django.utils import timezone
+
+from pulp_conda.app.downloaders import repodata_downloader_factory
+from pulp_conda.app.models import CondaRemote, RepodataCache
+
+
+log = logging.getLogger(__name__)
+
+
+def refresh_repodata_cache(remote_pk, relative_path):
+    """
+    Refresh a repodata.json cached by pull-through distributions.
+
+    The file is fetched with a conditional request, so an unmodified file is not downloaded
+    again.
+
+    Args:
+        remote_pk (str): The pk of the remote the file is fetched from.
+        relative_path (str): The path of the file relative to the remote url.
+    """
+    remote = CondaRemote.objects.get(pk=remote_pk)
+    caches = RepodataCache.objects.filter(remote=remote, relative_path=relative_path)
+    cache = caches.first()
+
+    try:
+        url = remote.get_remote_artifact_url(relative_path)
+        kwargs = {}
+        if cache is not None and url.startswith(("http://", "https://")):
+            kwargs = {"etag": cache.etag, "last_modified": cache.last_modified}
+
+        async def download():
+            async with repodata_downloader_factory(remote) as factory:
+                return await factory.build(url, **kwargs).run()
+
+        result = asyncio.get_event_loop().run_until_complete(download())
+        if result.path is None:
+            log.info(_("The cached {} is up to date.").format(relative_path))
+            caches.update(fetched_at=timezone.now())
+        else:
+            RepodataCache.store(remote, relative_path, result)
+    finally:
+        caches.update(refresh_started_at=None)
@@ -1,20 +1,500 @@
+import bz2
+import gzip
+import hashlib
 import logging
+import os
+import shutil
 import tempfile
 from gettext import gettext as _
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+import zstandard
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
 
 from pulpcore.plugin.models import (
+    ContentArtifact,
     RepositoryVersion,
     PublishedArtifact,
     PublishedMetadata,
-    RemoteArtifact,
 )
+from pulpcore.plugin.util import get_domain
 
-from pulp_conda.app.models import CondaRepository, Repodata, Package, CondaDistribution
+from pulp_conda.app.match_spec import InvalidMatchSpec, parse_match_spec
+from pulp_conda.app.models import (
+    CondaRepository,
+    CondaPublication,
+    Repodata,
+    Package,
+    PendingPackage,
+    Shard,
+)
+from pulp_conda.app.jlap import (
+    DEFAULT_IV,
+    diff_repodata,
+    patch_line,
+    read_jlap,
+    repodata_hash,
+    write_jlap,
+)
+from pulp_conda.app.shards import (
+    SHARDS_INDEX,
+    pack_shard,
+    shard_relative_path,
+    write_shard,
+    write_shards_index,
+)
+from pulp_conda.app.utils import write_channeldata, write_repodata
 
 
 log = logging.getLogger(__name__)
 
 
+def publish(repository_version_pk, sharded=False):
+    """
+    Create a Publication with a repodata.json based on a RepositoryVersion.
+
+    The repodata.json is generated from the metadata stored on the packages, so publishing does
+    not need to read any artifact. Only packages that were created before their metadata was
+    stored are indexed from their artifacts, once.
+
+    The publication of a channel repository contains a ``<subdir>/repodata.json`` for every
+    subdir, routed by the subdir of the package metadata, and a channeldata.json.
+
+    Args:
+        repository_version_pk (str): Create a publication from this repository version.
+        sharded (bool): Whether to also publish sharded repodata as specified by CEP-16.
+    """
+    repository_version = RepositoryVersion.objects.get(pk=repository_version_pk)
+
+    log.info(
+        _("Publishing: repository={repo}, version={ver}").format(
+            repo=repository_version.repository.name,
+            ver=repository_version.number,
+        )
+    )
+    channel = repository_version.repository.cast().channel
+    with tempfile.TemporaryDirectory(dir="."):
+        # The packages of a channel are published below their subdir, all other publications
+        # serve them by their filename.
+        with CondaPublication.create(
+            repository_version, pass_through=not channel
+        ) as publication:
+            publication.sharded = sharded
+            packages = Package.objects.filter(pk__in=repository_version.content)
+            _store_missing_metadata(packages.filter(sha256=""))
+
+            packages = packages.exclude(sha256="").order_by("name", "version", "build")
+            if channel:
+                _publish_channel(publication, packages)
+            else:
+                subdir = packages.exclude(subdir="").values_list("subdir", flat=True).first()
+                _publish_subdir(publication, packages, subdir or "noarch")
+
+    log.info(_("Publication: {publication} created").format(publication=publication.pk))
+    return publication
+
+
+def _publish_channel(publication, packages):
+    """
+    Publishes the packages and the repodata of every subdir of a channel and its
+    channeldata.json.
+
+    A noarch subdir is always published, as conda requires it. Packages without a subdir in
+    their metadata are published as noarch packages.
+    """
+    subdirs = {
+        subdir or "noarch"
+        for subdir in packages.order_by().values_list("subdir", flat=True).distinct()
+    }
+    subdirs.add("noarch")
+
+    for subdir in sorted(subdirs):
+        if subdir == "noarch":
+            subdir_packages = packages.filter(subdir__in=["noarch", ""])
+        else:
+            subdir_packages = packages.filter(subdir=subdir)
+        os.makedirs(subdir)
+        _publish_subdir(publication, subdir_packages, subdir, f"{subdir}/")
+        _publish_packages(publication, subdir_packages, f"{subdir}/")
+
+    with open("channeldata.json", "w") as channeldata:
+        write_channeldata(channeldata, subdirs, _channeldata_packages(packages))
+    PublishedMetadata.create_from_file(
+        file=File(open("channeldata.json", "rb")),
+        publication=publication,
+        relative_path="channeldata.json",
+    )
+
+
+def _publish_subdir(publication, packages, subdir, prefix=""):
+    """
+    Publishes the repodata.json of a subdir with all its variants.
+
+    Args:
+        publication (CondaPublication): The publication being created.
+        packages (QuerySet): The packages of the subdir.
+        subdir (str): The name of the subdir.
+        prefix (str): The directory of the subdir within the publication, e.g. "linux-64/".
+    """
+    with open(f"{prefix}repodata.json", "w") as repodata:
+        write_repodata(
+            repodata,
+            subdir,
+            _records(packages.filter(extension="tar.bz2")),
+            _records(packages.filter(extension="conda")),
+        )
+    _publish_metadata(publication, f"{prefix}repodata.json")
+
+    current_packages = packages.filter(pk__in=_current_packages(packages))
+    with open(f"{prefix}current_repodata.json", "w") as current_repodata:
+        write_repodata(
+            current_repodata,
+            subdir,
+            _records(current_packages.filter(extension="tar.bz2")),
+            _records(current_packages.filter(extension="conda")),
+        )
+    _publish_metadata(publication, f"{prefix}current_repodata.json")
+
+    _publish_jlap(publication, _previous_publication(publication), prefix)
+    if publication.sharded:
+        _publish_shards(publication, packages, subdir, prefix)
+
+
+def _publish_packages(publication, packages, prefix):
+    """
+    Publishes the artifacts of packages below a directory of the publication.
+    """
+    content_artifacts = ContentArtifact.objects.filter(content__in=packages.order_by())
+    PublishedArtifact.objects.bulk_create(
+        (
+            PublishedArtifact(
+                relative_path=f"{prefix}{content_artifact.relative_path}",
+                publication=publication,
+                content_artifact=content_artifact,
+            )
+            for content_artifact in content_artifacts.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+def _channeldata_packages(packages):
+    """
+    Yields the ``(name, entry)`` tuples of the channeldata.json of a channel.
+
+    Every entry holds the subdirs of the package and the version, license and timestamp of its
+    latest build. Packages are ordered by version in SQL, see `Package.version_key`.
+    """
+    rows = packages.order_by(
+        "name", F("version_key").desc(nulls_last=True), F("timestamp").desc(nulls_last=True)
+    ).values_list("name", "version", "version_key", "subdir", "license", "timestamp")
+    for name, group in groupby(rows.iterator(), key=itemgetter(0)):
+        subdirs = set()
+        latest = None
+        for _name, version, key, subdir, package_license, timestamp in group:
+            subdirs.add(subdir or "noarch")
+            if latest is None and key is not None:
+                latest = (version, package_license, timestamp)
+
+        entry = {"subdirs": sorted(subdirs)}
+        if latest is not None:
+            entry["version"], package_license, timestamp = latest
+            if package_license:
+                entry["license"] = package_license
+            if timestamp:
+                entry["timestamp"] = timestamp
+        yield name, entry
+
+
+def _publish_metadata(publication, relative_path):
+    """
+    Publishes a metadata file along with its zstd, bzip2 and gzip compressed variants.
+
+    All variants are written by streaming compressors, so memory usage is bounded regardless of
+    the size of the file. The zstd and gzip variants are also served as Content-Encoding of the
+    file itself, see `CondaDistribution.content_handler`.
+    """
+    size = os.path.getsize(relative_path)
+    with open(relative_path, "rb") as src, open(f"{relative_path}.zst", "wb") as dst:
+        compressor = zstandard.ZstdCompressor(level=settings.CONDA_REPODATA_ZSTD_LEVEL)
+        compressor.copy_stream(src, dst, size=size)
+    with open(relative_path, "rb") as src, bz2.open(
+        f"{relative_path}.bz2", "wb", compresslevel=settings.CONDA_REPODATA_BZ2_LEVEL
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    with open(relative_path, "rb") as src, gzip.GzipFile(
+        f"{relative_path}.gz", "wb", compresslevel=settings.CONDA_REPODATA_GZIP_LEVEL, mtime=0
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    for path in (
+        relative_path,
+        f"{relative_path}.zst",
+        f"{relative_path}.bz2",
+        f"{relative_path}.gz",
+    ):
+        PublishedMetadata.create_from_file(
+            file=File(open(path, "rb")), publication=publication, relative_path=path
+        )
+
+
+def _publish_jlap(publication, previous_publication, prefix=""):
+    """
+    Publishes a repodata.jlap, which extends the one of the previous publication by the patch
+    from its repodata.json to the one of this publication.
+    """
+    iv, patches = DEFAULT_IV, []
+    with open(f"{prefix}repodata.json", "rb") as repodata:
+        latest = repodata_hash(repodata)
+
+        previous_jlap = _open_published_metadata(previous_publication, f"{prefix}repodata.jlap")
+        if previous_jlap is not None:
+            with previous_jlap:
+                iv, patches = read_jlap(previous_jlap)
+
+        previous_repodata = _open_published_metadata(
+            previous_publication, f"{prefix}repodata.json"
+        )
+        if previous_repodata is not None:
+            with previous_repodata:
+                previous_hash = repodata_hash(previous_repodata)
+                if previous_hash != latest:
+                    patch = diff_repodata(previous_repodata, repodata)
+                    patches.append(patch_line(previous_hash, latest, patch))
+
+    with open(f"{prefix}repodata.jlap", "wb") as jlap:
+        write_jlap(jlap, iv, patches, latest, settings.CONDA_JLAP_MAX_SIZE)
+    PublishedMetadata.create_from_file(
+        file=File(open(f"{prefix}repodata.jlap", "rb")),
+        publication=publication,
+        relative_path=f"{prefix}repodata.jlap",
+    )
+
+
+def _publish_shards(publication, packages, subdir, prefix=""):
+    """
+    Publishes sharded repodata, with one shard per package name.
+
+    A shard whose content was compressed before, by any publication, reuses that artifact, see
+    `Shard`. Only new or changed shards are compressed.
+    """
+    level = settings.CONDA_REPODATA_ZSTD_LEVEL
+
+    fingerprints = {name: fingerprint for name, fingerprint, _data in _pack_shards(packages, level)}
+    known = {
+        shard.fingerprint: shard.artifact
+        for shard in Shard.objects.filter(
+            fingerprint__in=fingerprints.values(), _pulp_domain=get_domain()
+        ).select_related("artifact")
+    }
+
+    shards = {}
+    with transaction.atomic():
+        for name, fingerprint in fingerprints.items():
+            artifact = known.get(fingerprint)
+            if artifact is not None:
+                digest = bytes.fromhex(artifact.sha256)
+                _publish_artifact(publication, artifact, f"{prefix}{shard_relative_path(digest)}")
+                shards[name] = digest
+
+    changed = packages.exclude(name__in=shards)
+    for name, fingerprint, data in _pack_shards(changed, level):
+        with open("shard.msgpack.zst", "wb") as shard:
+            write_shard(shard, data, level)
+        with open("shard.msgpack.zst", "rb") as shard:
+            digest = hashlib.sha256(shard.read()).digest()
+        metadata = PublishedMetadata.create_from_file(
+            file=File(open("shard.msgpack.zst", "rb")),
+            publication=publication,
+            relative_path=f"{prefix}{shard_relative_path(digest)}",
+        )
+        try:
+            with transaction.atomic():
+                Shard.objects.create(fingerprint=fingerprint, artifact=metadata._artifacts.get())
+        except IntegrityError:
+            # A concurrent publication compressed the same shard.
+            pass
+        shards[name] = digest
+
+    with open(f"{prefix}{SHARDS_INDEX}", "wb") as index:
+        write_shards_index(index, subdir, shards, level)
+    PublishedMetadata.create_from_file(
+        file=File(open(f"{prefix}{SHARDS_INDEX}", "rb")),
+        publication=publication,
+        relative_path=f"{prefix}{SHARDS_INDEX}",
+    )
+
+
+def _pack_shards(packages, level):
+    """
+    Yields the ``(name, fingerprint, data)`` tuples of the shards of the given packages.
+
+    The fingerprint digests the compression level and the uncompressed shard, see `Shard`.
+    """
+    for name, group in groupby(packages.order_by("name").iterator(), key=attrgetter("name")):
+        group = sorted(group, key=attrgetter("relative_path"))
+        data = pack_shard(
+            _records_of(package for package in group if package.extension == "tar.bz2"),
+            _records_of(package for package in group if package.extension == "conda"),
+        )
+        fingerprint = hashlib.sha256(b"%d:" % level + data).hexdigest()
+        yield name, fingerprint, data
+
+
+def _publish_artifact(publication, artifact, relative_path):
+    """
+    Publishes an existing artifact as metadata of a publication.
+    """
+    metadata = PublishedMetadata.objects.create(
+        relative_path=relative_path, publication=publication
+    )
+    content_artifact = ContentArtifact.objects.create(
+        artifact=artifact, content=metadata, relative_path=relative_path
+    )
+    PublishedArtifact.objects.create(
+        relative_path=relative_path, publication=publication, content_artifact=content_artifact
+    )
+
+
+def _previous_publication(publication):
+    """
+    Returns the most recent complete publication of the same repository, if any.
+
+    Args:
+        publication (CondaPublication): The publication being created.
+    """
+    publications = CondaPublication.objects.filter(
+        repository_version__repository=publication.repository_version.repository,
+        complete=True,
+    )
+    return (
+        publications.exclude(pk=publication.pk)
+        .order_by("-repository_version__number", "-pulp_created")
+        .first()
+    )
+
+
+def _open_published_metadata(publication, relative_path):
+    """
+    Opens a metadata file of a publication, returns None if the publication does not have it.
+    """
+    if publication is None:
+        return None
+
+    metadata = publication.published_metadata.filter(relative_path=relative_path).first()
+    if metadata is None:
+        return None
+
+    return metadata._artifacts.get().file.open("rb")
+
+
+def _current_packages(packages):
+    """
+    Selects the packages of current_repodata.json.
+
+    These are all builds of the latest version of every package name. For every dependency of a
+    selected package that none of the selected packages of that name satisfies, all builds of the
+    latest version that does are selected as well.
+
+    Returns:
+        set: The primary keys of the selected packages.
+    """
+    rows = packages.order_by("name", F("version_key").desc(nulls_last=True)).values_list(
+        "pk", "name", "version", "version_key", "build", "build_number", "depends"
+    )
+    return _select_current(rows.iterator())
+
+
+def _select_current(rows):
+    """
+    Selects the packages of current_repodata.json, see `_current_packages`.
+
+    Args:
+        rows: The ``(pk, name, version, version_key, build, build_number, depends)`` tuples of
+            the packages, ordered by name and by version key, newest first.
+
+    Returns:
+        set: The primary keys of the selected packages.
+    """
+    # The candidates of every name, newest version first.
+    candidates = {}
+    for name, group in groupby(rows, key=itemgetter(1)):
+        entries = []
+        for pk, _name, version, key, build, build_number, depends in group:
+            if key is None:
+                log.warning(_("Ignoring package with invalid version: {}").format(pk))
+                continue
+            entries.append((bytes(key), pk, build, build_number, depends, version))
+        candidates[name] = entries
+
+    selected = set()
+    queue = []
+
+    def select_latest(entries):
+        for entry in entries:
+            if entry[0] != entries[0][0]:
+                break
+            if entry[1] not in selected:
+                selected.add(entry[1])
+                queue.append(entry)
+
+    for entries in candidates.values():
+        if entries:
+            select_latest(entries)
+
+    while queue:
+        for dependency in queue.pop()[4]:
+            try:
+                spec = parse_match_spec(dependency)
+            except InvalidMatchSpec:
+                continue
+            entries = candidates.get(spec.name, [])
+            matching = [e for e in entries if spec.match(spec.name, e[5], e[2], e[3])]
+            if matching and not any(e[1] in selected for e in matching):
+                select_latest(matching)
+
+    return selected
+
+
+def _records(packages):
+    """
+    Yields the ``(filename, record)`` tuples of the given packages.
+    """
+    return _records_of(packages.iterator())
+
+
+def _records_of(packages):
+    for package in packages:
+        yield package.relative_path, package.to_record()
+
+
+def _store_missing_metadata(packages):
+    """
+    Reads and stores the metadata of packages which do not have it yet from their artifacts.
+
+    Packages whose artifact has not been downloaded are left untouched and cannot be published.
+    """
+    fields = list(Package.metadata_from_index({}))
+    for package in packages.iterator():
+        content_artifact = package.contentartifact_set.select_related("artifact").first()
+        if content_artifact is None or content_artifact.artifact is None:
+            log.warning(
+                _("Skipping package without metadata or artifact: {}").format(
+                    package.relative_path
+                )
+            )
+            continue
+
+        metadata = Package.metadata_from_artifact(content_artifact.artifact, package.extension)
+        for field, value in metadata.items():
+            setattr(package, field, value)
+        package.save(update_fields=fields)
+
+
 def publish_package(repository_pk, package_pk):
     """
     Create a new Repository version when a new package is uploaded and switch distribution to new version.
@@ -26,9 +506,52 @@ def publish_package(repository_pk, package_pk):
 
     repository = CondaRepository.objects.get(pk=repository_pk)
 
+    if settings.CONDA_COALESCE_UPLOADS:
+        _publish_pending_packages(repository, package_pk)
+        return
+
     with repository.new_version() as new_version:
         new_version.add_content(Package.objects.filter(pk=package_pk))
 
+
+def _publish_pending_packages(repository, package_pk):
+    """
+    Add the package and all packages pending for a repository in a single new repository version.
+
+    The first of several queued tasks picks up the packages of all of them, the others only add
+    their own package, if it is still missing. The tasks are serialized by their exclusive
+    resource on the repository.
+    """
+    with transaction.atomic():
+        pending = PendingPackage.objects.filter(repository=repository)
+        package_pks = set(pending.values_list("package_id", flat=True))
+        package_pks.add(package_pk)
+        pending.filter(package_id__in=package_pks).delete()
+
+        packages = Package.objects.filter(pk__in=package_pks).exclude(
+            pk__in=repository.latest_version().content
+        )
+        if not packages.exists():
+            log.info(_("The packages were already added by another task."))
+            return
+        with repository.new_version() as new_version:
+            new_version.add_content(packages)
+
+
+def add_packages(repository_pk, package_pks):
+    """
+    Create a single new Repository version containing all given packages.
+
+    Args:
+        repository_pk (str): Create a new version for this repository.
+        package_pks (list): Add these packages to the new repository version.
+    """
+    repository = CondaRepository.objects.get(pk=repository_pk)
+
+    with repository.new_version() as new_version:
+        new_version.add_content(Package.objects.filter(pk__in=package_pks))
+
+
 def publish_repodata(repository_pk, repodata_pk):
     """
     Create a new Repository version when a new repodata is uploaded and switch distribution to new version.
@@ -45,4 +568,4 @@ def publish_repodata(repository_pk, repodata_pk):
         # All objects = last uploaded repodata.json. This is needed because otherwise there are two files with the same
         # relative_path and Pulp does not know which one to serve.
         new_version.remove_content(Repodata.objects.all())
-        new_version.add_content(Repodata.objects.filter(pk=repodata_pk))
\ No newline at end of file
+        new_version.add_content(Repodata.objects.filter(pk=repodata_pk))
@@ -1,7 +1,12 @@
 from gettext import gettext as _
+import asyncio
 import logging
+from urllib.parse import urljoin
 
-from pulpcore.plugin.models import Artifact, ProgressReport, Remote, Repository
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from pulpcore.plugin.models import Artifact, ProgressReport, Remote
 from pulpcore.plugin.stages import (
     DeclarativeArtifact,
     DeclarativeContent,
@@ -9,11 +14,29 @@ from pulpcore.plugin.stages import (
     Stage,
 )
 
-from pulp_conda.app.models import Package, CondaRemote
+from pulp_conda.app.closure import PackageIndex, dependency_closure
+from pulp_conda.app.downloaders import repodata_downloader_factory
+from pulp_conda.app.match_spec import parse_match_spec
+from pulp_conda.app.models import CondaRemote, CondaRepository, Package, Repodata, SyncState
+from pulp_conda.app.utils import (
+    decode_fingerprint,
+    encode_fingerprint,
+    extract_package_info,
+    iter_repodata_packages,
+    read_repodata_info,
+    record_fingerprint,
+)
+from pulp_conda.app.version import version_key
 
 
 log = logging.getLogger(__name__)
 
+# The number of stale packages removed with a single query.
+REMOVE_BATCH_SIZE = 500
+
+# The number of package records parsed in a thread at once.
+PARSE_BATCH_SIZE = 1000
+
 
 def synchronize(remote_pk, repository_pk, mirror):
     """
@@ -27,24 +50,170 @@ def synchronize(remote_pk, repository_pk, mirror):
         mirror (bool): True for mirror mode, False for additive.
 
     Raises:
-        ValueError: If the remote does not specify a URL to sync
+        ValueError: If the remote does not specify a URL to sync, or has subdirs but the
+            repository is not a channel repository.
 
     """
     remote = CondaRemote.objects.get(pk=remote_pk)
-    repository = Repository.objects.get(pk=repository_pk)
+    repository = CondaRepository.objects.get(pk=repository_pk)
 
     if not remote.url:
         raise ValueError(_("A remote must have a url specified to synchronize."))
+    if remote.subdirs and not repository.channel:
+        # A flat repository publishes a single repodata.json for one subdir.
+        raise ValueError(_("A remote with subdirs can only be synced into a channel repository."))
 
     # Interpret policy to download Artifacts or not
     deferred_download = remote.policy != Remote.IMMEDIATE
     first_stage = CondaFirstStage(remote, deferred_download)
-    DeclarativeVersion(first_stage, repository, mirror=mirror).create()
+
+    # The repodata.json files are fetched conditionally before the pipeline is set up, so a sync
+    # without upstream changes does not touch the content pipeline at all.
+    states = {
+        state.subdir: state
+        for state in SyncState.objects.filter(remote=remote, repository=repository)
+    }
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(first_stage.fetch_repodata(states))
+    version = repository.latest_version().number
+    if all(
+        _unmodified(result, states.get(subdir or ""), version, mirror, remote)
+        for subdir, result in results.items()
+    ):
+        log.info(_("The repodata of the remote has not changed, skipping sync."))
+        return
+
+    first_stage.prefetched = {
+        subdir: result for subdir, result in results.items() if result.path is not None
+    }
+    # Only the packages that changed since the last sync are emitted, if the repository is still
+    # at the version the last sync created. Stale packages are then removed by
+    # RemoveStaleContent, because the pipeline itself cannot mirror a partial list.
+    first_stage.states = states
+    first_stage.mirror = mirror
+    first_stage.incremental = all(
+        _incremental(states.get(subdir or ""), version, mirror, remote) for subdir in results
+    )
+    CondaDeclarativeVersion(
+        first_stage, repository, mirror=mirror and not first_stage.incremental
+    ).create()
+    _save_states(remote, repository, results, first_stage)
+
+
+def _unmodified(result, state, version, mirror, remote):
+    """
+    Whether a repodata.json did not change since the last sync, which resulted in the version.
+
+    Changing the remote, e.g. its filters, also counts as a change.
+    """
+    if state is None or state.version != version:
+        return False
+    if remote.pulp_last_updated and remote.pulp_last_updated > state.pulp_last_updated:
+        return False
+    # After an additive sync, the repository may hold packages a mirror sync has to remove.
+    if mirror and not state.mirror:
+        return False
+    return result.path is None or result.artifact_attributes["sha256"] == state.sha256
+
+
+def _incremental(state, version, mirror, remote):
+    """
+    Whether only the changes of a repodata.json since the last sync need to be applied.
+    """
+    if state is None or not state.fingerprint or state.version != version:
+        return False
+    if remote.pulp_last_updated and remote.pulp_last_updated > state.pulp_last_updated:
+        # The filters of the remote may have changed.
+        return False
+    # After an additive sync, the repository may hold packages a mirror sync has to remove.
+    return state.mirror or not mirror
+
+
+def _save_states(remote, repository, results, first_stage):
+    """
+    Stores the ETag, Last-Modified header, digest and fingerprint of every repodata.json.
+    """
+    version = repository.latest_version().number
+    for subdir, result in results.items():
+        state = first_stage.states.get(subdir or "") or SyncState(
+            remote=remote, repository=repository, subdir=subdir or ""
+        )
+        if result.path is not None:
+            state.etag = result.headers.get("ETag", "")
+            state.last_modified = result.headers.get("Last-Modified", "")
+            state.sha256 = result.artifact_attributes["sha256"]
+        if subdir in first_stage.fingerprints:
+            state.fingerprint = encode_fingerprint(first_stage.fingerprints[subdir])
+        state.mirror = first_stage.mirror
+        state.version = version
+        state.save()
+
+
+class CondaDeclarativeVersion(DeclarativeVersion):
+    """
+    A DeclarativeVersion, which removes stale packages after an incremental mirror sync.
+    """
+
+    def pipeline_stages(self, new_version):
+        pipeline = super().pipeline_stages(new_version)
+        if self.first_stage.incremental and self.first_stage.mirror:
+            pipeline.append(RemoveStaleContent(new_version, self.first_stage))
+        return pipeline
+
+
+class RemoveStaleContent(Stage):
+    """
+    The last stage of an incremental mirror sync, which removes the packages and repodata.json
+    files that are no longer upstream from the new version.
+    """
+
+    def __init__(self, new_version, first_stage):
+        """
+        Args:
+            new_version (RepositoryVersion): The repository version being created.
+            first_stage (CondaFirstStage): The first stage, which collected the stale content.
+        """
+        super().__init__()
+        self.new_version = new_version
+        self.first_stage = first_stage
+
+    async def run(self):
+        """
+        Pass all content on and remove the stale content once the pipeline is drained.
+        """
+        async for batch in self.batches():
+            for d_content in batch:
+                await self.put(d_content)
+        await sync_to_async(self.remove_stale_content)()
+
+    def remove_stale_content(self):
+        """
+        Removes the packages and repodata.json files the first stage found to be stale.
+        """
+        content = self.new_version.content
+        for subdir, filenames in self.first_stage.removed.items():
+            for start in range(0, len(filenames), REMOVE_BATCH_SIZE):
+                query = Q()
+                for filename in filenames[start : start + REMOVE_BATCH_SIZE]:
+                    name, version, build, extension = extract_package_info(filename)
+                    query |= Q(name=name, version=version, build=build, extension=extension)
+                self.new_version.remove_content(
+                    Package.objects.filter(query, pk__in=content, subdir=subdir)
+                )
+        self.new_version.remove_content(
+            Repodata.objects.filter(pk__in=content, digest__in=self.first_stage.stale_repodata)
+        )
 
 
 class CondaFirstStage(Stage):
     """
     The first stage of a pulp_conda sync pipeline.
+
+    The remote url points to a channel subdir, e.g.
+    ``https://conda.anaconda.org/conda-forge/noarch``, or, if the remote lists subdirs, to the
+    channel itself. The ``repodata.json`` of every subdir is fetched and parsed concurrently, in
+    threads, and all packages feed the same pipeline. Every ``repodata.json`` is parsed
+    incrementally, so memory usage does not grow with the size of the channel.
     """
 
     def __init__(self, remote, deferred_download):
@@ -52,7 +221,7 @@ class CondaFirstStage(Stage):
         The first stage of a pulp_conda sync pipeline.
 
         Args:
-            remote (FileRemote): The remote data to be used when syncing
+            remote (CondaRemote): The remote data to be used when syncing
             deferred_download (bool): if True the downloading will not happen now. If False, it will
                 happen immediately.
 
@@ -60,37 +229,348 @@ class CondaFirstStage(Stage):
         super().__init__()
         self.remote = remote
         self.deferred_download = deferred_download
+        self.prefetched = {}
+        self.states = {}
+        self.mirror = False
+        self.incremental = False
+        self.fingerprints = {}
+        self.removed = {}
+        self.stale_repodata = []
+        self.selected = None
+
+    @property
+    def base_url(self):
+        """
+        The url of the channel or channel subdir, always ending with a slash.
+        """
+        url = self.remote.url
+        if url.endswith("repodata.json"):
+            url = url[: -len("repodata.json")]
+        return url if url.endswith("/") else f"{url}/"
+
+    def subdir_url(self, subdir):
+        """
+        The url of a channel subdir, always ending with a slash.
+
+        Args:
+            subdir (str): The subdir, or None if the remote url points to a single subdir.
+        """
+        return urljoin(self.base_url, f"{subdir}/") if subdir else self.base_url
+
+    @property
+    def subdirs(self):
+        """
+        The subdirs to sync, ``[None]`` if the remote url points to a single subdir.
+        """
+        return self.remote.subdirs or [None]
+
+    def semaphore(self):
+        """
+        Returns a semaphore limiting metadata downloads.
+
+        Metadata downloads share the concurrency limit of the remote with the artifacts.
+        """
+        return asyncio.Semaphore(
+            self.remote.download_concurrency or Remote.DEFAULT_DOWNLOAD_CONCURRENCY
+        )
+
+    async def fetch_repodata(self, states):
+        """
+        Fetches the repodata.json of every subdir with conditional requests.
+
+        Args:
+            states (dict): The `SyncState` of the previous sync of every subdir.
+
+        Returns:
+            dict: The `DownloadResult` of every subdir. Its path is None if the repodata.json
+                has not been modified.
+        """
+        semaphore = self.semaphore()
+
+        async with repodata_downloader_factory(self.remote) as factory:
+
+            async def fetch(subdir):
+                url = urljoin(self.subdir_url(subdir), "repodata.json")
+                state = states.get(subdir or "")
+                kwargs = {}
+                if state is not None and url.startswith(("http://", "https://")):
+                    kwargs = {"etag": state.etag, "last_modified": state.last_modified}
+                async with semaphore:
+                    return subdir, await factory.build(url, **kwargs).run()
+
+            return dict(await asyncio.gather(*(fetch(subdir) for subdir in self.subdirs)))
 
     async def run(self):
         """
-        Build and emit `DeclarativeContent` from the Manifest data.
+        Build and emit `DeclarativeContent` from the repodata.json of every subdir of the remote.
+        """
+        subdirs = self.subdirs
+        semaphore = self.semaphore()
+
+        async with ProgressReport(
+            message="Downloading Metadata", code="sync.downloading.metadata", total=len(subdirs)
+        ) as metadata_pb, ProgressReport(
+            message="Parsing Packages", code="sync.parsing.packages"
+        ) as packages_pb:
+            if self.remote.root_specs:
+                await self.resolve_root_specs(semaphore)
+            await asyncio.gather(
+                *(
+                    self.sync_subdir(subdir, semaphore, metadata_pb, packages_pb)
+                    for subdir in subdirs
+                )
+            )
+
+    async def download_repodata(self, subdir, semaphore):
+        """
+        Downloads the repodata.json of a subdir, unless it has been fetched already.
+        """
+        if subdir not in self.prefetched:
+            url = urljoin(self.subdir_url(subdir), "repodata.json")
+            async with semaphore:
+                self.prefetched[subdir] = await self.remote.get_downloader(url=url).run()
+        return self.prefetched[subdir]
+
+    async def resolve_root_specs(self, semaphore):
+        """
+        Selects the packages of the dependency closure of the root specs of the remote.
+
+        The repodata.json of all subdirs is needed up front, as dependencies cross subdirs. It
+        is parsed into an in-memory index by package name, the packages are then emitted by a
+        second streaming pass over the same files.
+        """
+        await asyncio.gather(
+            *(self.download_repodata(subdir, semaphore) for subdir in self.subdirs)
+        )
+        self.selected = await asyncio.to_thread(self.build_closure)
+
+    def build_closure(self):
+        """
+        Returns the selected filenames of every subdir, see `dependency_closure`.
+        """
+        index = PackageIndex()
+        for subdir in self.subdirs:
+            with open(self.prefetched[subdir].path, "rb") as repodata:
+                for filename, record in self.filter_records(iter_repodata_packages(repodata)):
+                    index.add(subdir, filename, record)
+
+        root_specs = [parse_match_spec(spec) for spec in self.remote.root_specs]
+        for spec in root_specs:
+            if not index.matching(spec, set(self.subdirs)):
+                log.warning(_("No package matches the root spec: {}").format(spec))
+        return dependency_closure(index, root_specs)
+
+    async def sync_subdir(self, subdir, semaphore, metadata_pb, packages_pb):
+        """
+        Fetch and parse the repodata.json of a subdir and emit its `DeclarativeContent`.
 
         Args:
-            in_q (asyncio.Queue): Unused because the first stage doesn't read from an input queue.
-            out_q (asyncio.Queue): The out_q to send `DeclarativeContent` objects to
-
-        """
-        downloader = self.remote.get_downloader(url=self.remote.url)
-        result = await downloader.run()
-        # Use ProgressReport to report progress
-        for entry in self.read_my_metadata_file_somehow(result.path):
-            unit = CondaContent(entry)  # make the content unit in memory-only
-            artifact = Artifact(entry)  # make Artifact in memory-only
-            da = DeclarativeArtifact(
-                artifact,
-                entry.url,
-                entry.relative_path,
-                self.remote,
-                deferred_download=self.deferred_download,
+            subdir (str): The subdir, or None if the remote url points to a single subdir.
+            semaphore (asyncio.Semaphore): Limits the number of concurrent metadata downloads.
+            metadata_pb (ProgressReport): Counts the downloaded repodata.json files.
+            packages_pb (ProgressReport): Counts the parsed packages.
+        """
+        base_url = self.subdir_url(subdir)
+        state = self.states.get(subdir or "")
+        result = self.prefetched.get(subdir)
+
+        previous = None
+        if self.incremental:
+            unchanged = result is None or result.artifact_attributes["sha256"] == state.sha256
+            # The dependency closure of root specs may change with any other subdir.
+            if unchanged and not self.remote.root_specs:
+                await metadata_pb.aincrement()
+                return
+            previous = decode_fingerprint(state.fingerprint)
+            if not unchanged:
+                self.stale_repodata.append(state.sha256)
+
+        result = await self.download_repodata(subdir, semaphore)
+        await metadata_pb.aincrement()
+
+        fingerprint = {}
+        with open(result.path, "rb") as repodata:
+            # Parsing runs in threads, so the subdirs are parsed concurrently and the event loop
+            # keeps feeding the pipeline.
+            info = await asyncio.to_thread(read_repodata_info, repodata)
+            info_subdir = info.get("subdir", subdir or "")
+            records = self.filter_records(iter_repodata_packages(repodata))
+            if self.selected is not None:
+                selected = self.selected.get(subdir, set())
+                records = (
+                    (filename, record) for filename, record in records if filename in selected
+                )
+            while True:
+                batch = await asyncio.to_thread(
+                    self.parse_records, records, previous, fingerprint, info_subdir, base_url
+                )
+                if not batch:
+                    break
+                for dc in batch:
+                    await self.put(dc)
+                await packages_pb.aincrease_by(len(batch))
+
+        self.fingerprints[subdir] = fingerprint
+        if previous:
+            self.removed[info_subdir] = list(previous)
+
+        if self.filtered:
+            # The upstream repodata.json lists packages the repository does not have.
+            return
+
+        # The upstream repodata.json is kept as well, so the synced repository can be served as is.
+        artifact = Artifact(
+            **result.artifact_attributes, file=result.path, pulp_domain=self.remote.pulp_domain
+        )
+        da = DeclarativeArtifact(
+            artifact=artifact,
+            url=result.url,
+            relative_path=f"{subdir}/repodata.json" if subdir else "repodata.json",
+            remote=self.remote,
+            deferred_download=False,
+        )
+        repodata = Repodata(digest=result.artifact_attributes["sha256"])
+        await self.put(DeclarativeContent(content=repodata, d_artifacts=[da]))
+
+    def parse_records(self, records, previous, fingerprint, info_subdir, base_url):
+        """
+        Builds the `DeclarativeContent` of the next package records of a repodata.json.
+
+        Args:
+            records: An iterator of ``(filename, record)`` tuples, which is resumed by every call.
+            previous (dict): The fingerprint of the previous sync, whose unchanged records are
+                skipped and popped, or None.
+            fingerprint (dict): The fingerprint of this sync, updated with every record.
+            info_subdir (str): The subdir of records without one.
+            base_url (str): The url of the subdir.
+
+        Returns:
+            list: At most `PARSE_BATCH_SIZE` `DeclarativeContent`, none once all are parsed.
+        """
+        batch = []
+        for filename, record in records:
+            digest = record_fingerprint(record)
+            fingerprint[filename] = digest
+            if previous is not None and previous.pop(filename, None) == digest:
+                continue
+            record.setdefault("subdir", info_subdir)
+            dc = self.package_content(filename, record, base_url)
+            if dc is None:
+                log.warning(_("Skipping invalid package filename: {}").format(filename))
+                continue
+            batch.append(dc)
+            if len(batch) == PARSE_BATCH_SIZE:
+                break
+        return batch
+
+    @property
+    def filtered(self):
+        """
+        Whether the remote syncs only some of the upstream packages.
+        """
+        return bool(
+            self.remote.includes
+            or self.remote.excludes
+            or self.remote.latest_n
+            or self.remote.root_specs
+        )
+
+    def filter_records(self, records):
+        """
+        Yields the package records passing the filters of the remote.
+
+        The include and exclude specs are evaluated per record while parsing. To keep only the
+        latest N versions of every name, the records of at most N versions per name are buffered
+        and yielded once all records are parsed.
+
+        Args:
+            records: An iterable of ``(filename, record)`` tuples.
+        """
+        includes = [parse_match_spec(spec) for spec in self.remote.includes]
+        excludes = [parse_match_spec(spec) for spec in self.remote.excludes]
+        latest_n = self.remote.latest_n
+        latest = {}
+
+        for filename, record in records:
+            package = (
+                record.get("name", ""),
+                record.get("version", ""),
+                record.get("build", ""),
+                record.get("build_number"),
             )
-            dc = DeclarativeContent(content=unit, d_artifacts=[da])
-            await self.put(dc)
+            if includes and not any(spec.match(*package) for spec in includes):
+                continue
+            if any(spec.match(*package) for spec in excludes):
+                continue
+            if not latest_n:
+                yield filename, record
+                continue
+            _keep_latest(latest.setdefault(package[0], {}), filename, record, latest_n)
+
+        for versions in latest.values():
+            for version_records in versions.values():
+                yield from version_records
 
-    def read_my_metadata_file_somehow(self, path):
+    def package_content(self, filename, record, base_url=None):
         """
-        Parse the metadata for conda Content type.
+        Build the `DeclarativeContent` for a single repodata.json package record.
 
         Args:
-            path: Path to the metadata file
+            filename (str): The filename of the package, i.e. the key of the record.
+            record (dict): The package record.
+            base_url (str): The url of the subdir of the package, defaults to `base_url`.
+
+        Returns:
+            The `DeclarativeContent` of the package or None if the filename is invalid.
         """
-        return []
+        name, version, build, extension = extract_package_info(filename)
+
+        if None in [name, version, build, extension]:
+            return None
+
+        metadata = Package.metadata_from_index(record)
+        # A patched record results in a new Package, the existing one may be in other versions.
+        package = Package(
+            name=name,
+            version=version,
+            build=build,
+            extension=extension,
+            version_key=version_key(version),
+            metadata_digest=Package.digest_metadata(metadata),
+            **metadata,
+        )
+        artifact = Artifact(size=record.get("size"), sha256=record.get("sha256"))
+        da = DeclarativeArtifact(
+            artifact=artifact,
+            url=urljoin(base_url or self.base_url, filename),
+            relative_path=package.relative_path,
+            remote=self.remote,
+            deferred_download=self.deferred_download,
+        )
+        return DeclarativeContent(content=package, d_artifacts=[da])
+
+
+def _keep_latest(versions, filename, record, n):
+    """
+    Adds a record to the records of the latest N versions of a package name.
+
+    Args:
+        versions (dict): The records of every kept version, by version key.
+        filename (str): The filename of the package.
+        record (dict): The package record.
+        n (int): The number of versions to keep.
+    """
+    key = version_key(record.get("version", ""))
+    if key is None:
+        log.warning(_("Skipping package with invalid version: {}").format(filename))
+        return
+
+    if key in versions:
+        versions[key].append((filename, record))
+        return
+    if len(versions) >= n:
+        oldest = min(versions)
+        if not oldest < key:
+            return
+        del versions[oldest]
+    versions[key] = [(filename, record)]
@@ -0,0 +1,77 @@
+from gettext import gettext as _
+import hashlib
+import logging
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import IntegrityError, transaction
+
+from pulpcore.plugin.models import Artifact, CreatedResource, Upload
+from pulpcore.plugin.util import get_domain
+
+from pulp_conda.app.models import Package
+from pulp_conda.app.tasks.publishing import publish_package
+from pulp_conda.app.utils import extract_package_info
+
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def upload_package(upload_pk, filename, repository_pk):
+    """
+    Create a package from a chunked upload and add it to a repository.
+
+    The package is added by `publish_package`, so concurrent uploads are coalesced with
+    ``CONDA_COALESCE_UPLOADS`` just like direct ones.
+
+    The chunks are assembled into a single temporary file and hashed in the same pass. Saving the
+    artifact moves that file into the artifact storage.
+
+    Args:
+        upload_pk (str): The pk of the completed upload.
+        filename (str): The filename of the conda package.
+        repository_pk (str): Add the package to a new version of this repository.
+
+    Raises:
+        ValueError: If the chunks do not cover the whole upload, the package is invalid, or a
+            package with the same filename and subdir but a different digest exists.
+    """
+    upload = Upload.objects.get(pk=upload_pk)
+    name, version, build, extension = extract_package_info(filename)
+
+    hashers = {name: hashlib.new(name) for name in Artifact.DIGEST_FIELDS}
+    md5 = hashlib.md5(usedforsecurity=False)
+    with TemporaryUploadedFile(filename, "application/octet-stream", upload.size, None) as file:
+        offset = 0
+        for chunk in upload.chunks.order_by("offset"):
+            if chunk.offset != offset:
+                raise ValueError(_("The upload is missing the chunk at offset {}.").format(offset))
+            with chunk.file.open("rb") as chunk_file:
+                for data in iter(lambda: chunk_file.read(CHUNK_SIZE), b""):
+                    file.write(data)
+                    md5.update(data)
+                    for hasher in hashers.values():
+                        hasher.update(data)
+            offset += chunk.size
+        if offset != upload.size:
+            raise ValueError(
+                _("The upload has {} of {} bytes.").format(offset, upload.size)
+            )
+        file.seek(0)
+
+        digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+        artifact = Artifact(file=file, size=upload.size, **digests)
+        metadata = Package.metadata_from_file(file, extension, artifact, md5=md5.hexdigest())
+        try:
+            with transaction.atomic():
+                artifact.save()
+        except IntegrityError:
+            artifact = Artifact.objects.get(sha256=artifact.sha256, pulp_domain=get_domain())
+
+    package = Package.get_or_create_from_artifact(filename, artifact, metadata)
+    CreatedResource.objects.create(content_object=package)
+    upload.delete()
+
+    # The task holds the repository, so the package is added like any other upload.
+    publish_package(repository_pk, package.pk)
@@ -1,22 +1,301 @@
-import re
+import hashlib
+import json
+import tarfile
+import zipfile
+from functools import lru_cache
+from gettext import gettext as _
+
+import ijson
+import msgpack
+import zstandard
+
+REPODATA_PACKAGE_SECTIONS = {"packages": ".tar.bz2", "packages.conda": ".conda"}
+
+
+# Package extensions and their suffix.
+PACKAGE_EXTENSIONS = (("conda", ".conda"), ("tar.bz2", ".tar.bz2"))
+# The characters allowed in the parts of the filename of a package:
+# "<name>-<version>-<build>.<extension>". Neither the version nor the build string can contain a
+# dash, so the name is everything before the last two. A string consists of allowed characters
+# only if stripping them leaves nothing, which is much cheaper than a regex match.
+_ALPHANUMERIC = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+PACKAGE_NAME_CHARS = _ALPHANUMERIC + "_.-"
+PACKAGE_VERSION_CHARS = _ALPHANUMERIC + "_.!+*"
+PACKAGE_BUILD_CHARS = _ALPHANUMERIC + "_.+"
+SUBDIR_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_-"
+
+
+class PackageFilename:
+    """
+    The parts of the filename of a conda package, see `parse_package_filename`.
+
+    Attributes:
+        name (str): The name of the package.
+        version (str): The version of the package.
+        build (str): The build string of the package.
+        extension (str): The extension of the package, i.e. "conda" or "tar.bz2".
+        build_number (int): The build number ending the build string, or None.
+        subdir (str): The subdir the package was requested from, e.g. "linux-64", or None.
+    """
+
+    __slots__ = ("name", "version", "build", "extension", "build_number", "subdir")
+
+    def __init__(self, name, version, build, extension, build_number=None, subdir=None):
+        self.name = name
+        self.version = version
+        self.build = build
+        self.extension = extension
+        self.build_number = build_number
+        self.subdir = subdir
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.name!r}, {self.version!r}, {self.build!r}, "
+            f"{self.extension!r}, build_number={self.build_number!r}, subdir={self.subdir!r})"
+        )
+
+
+@lru_cache(maxsize=8192)
+def parse_package_filename(relative_path):
+    """
+    Parses the (relative) path of a conda package, caching the result.
+
+    Only the basename is parsed. Packages of a channel are requested below their subdir, e.g.
+    "linux-64/<filename>", which is returned as subdir if it is a valid subdir name.
+
+    Args:
+        relative_path (str): The (relative) path string. "[<subdir>/]name-version-build.ext"
+
+    Returns:
+        PackageFilename: The parts of the filename, or None if it is not a package filename.
+    """
+    directory, _sep, filename = relative_path.rpartition("/")
+    for extension, suffix in PACKAGE_EXTENSIONS:
+        if filename.endswith(suffix):
+            break
+    else:
+        return None
+
+    parts = filename[: -len(suffix)].rsplit("-", 2)
+    if len(parts) != 3:
+        return None
+    name, version, build = parts
+    if (
+        not name
+        or name[0] == "-"
+        or name.strip(PACKAGE_NAME_CHARS)
+        or not version
+        or version.strip(PACKAGE_VERSION_CHARS)
+        or not build
+        or build.strip(PACKAGE_BUILD_CHARS)
+    ):
+        return None
+
+    # The build string ends with the build number, e.g. "py312h0_0" or "0".
+    build_number = build.rpartition("_")[2]
+    subdir = directory.rpartition("/")[2]
+    if not subdir or subdir[0] == "-" or subdir[-1] == "-" or subdir.strip(SUBDIR_CHARS):
+        subdir = None
+    return PackageFilename(
+        name,
+        version,
+        build,
+        extension,
+        int(build_number) if build_number.isdigit() else None,
+        subdir,
+    )
 
 
 def extract_package_info(relative_path):
-    """ "
+    """
     Tries to extract the name, version and build of a package from the (relative) path string.
 
     Args:
       The (relative) path string. "name-version-build.{conda,tar.bz2}"
+
+    Returns:
+      The ``(name, version, build, extension)`` tuple, all None if the path is not a package.
     """
+    package = parse_package_filename(relative_path)
+    if package is None:
+        return None, None, None, None
+    return package.name, package.version, package.build, package.extension
 
-    pattern = r"^(?P<name>.+)-(?P<version>\d.+)-(?P<build>.+)\.(?P<extension>conda|tar\.bz2)$"
-    match = re.match(pattern, relative_path)
 
-    if match:
-        name = match.group("name")
-        version = match.group("version")
-        build = match.group("build")
-        extension = match.group("extension")
-        return name, version, build, extension
-    else:
-        return None, None, None, None
+def iter_repodata_packages(fileobj):
+    """
+    Lazily yields the package records of a repodata.json document.
+
+    The document is parsed incrementally, so only a single package record is held in memory at any
+    given time. Both the ``packages`` and the ``packages.conda`` maps are read, one after another,
+    which requires ``fileobj`` to be seekable.
+
+    Args:
+        fileobj: A binary file object containing a repodata.json document.
+
+    Yields:
+        A ``(filename, record)`` tuple for every package listed in the document.
+    """
+    for section, extension in REPODATA_PACKAGE_SECTIONS.items():
+        fileobj.seek(0)
+        for filename, record in ijson.kvitems(fileobj, section, use_float=True):
+            # ijson joins nested keys with dots, so the prefix "packages.conda" would also match a
+            # key named "conda" inside "packages"; only accept keys with the expected extension.
+            if filename.endswith(extension) and isinstance(record, dict):
+                yield filename, record
+
+
+def read_repodata_info(fileobj):
+    """
+    Reads the "info" object of a repodata.json document.
+
+    Args:
+        fileobj: A binary file object containing a repodata.json document.
+
+    Returns:
+        dict: The "info" object, empty if the document does not have one.
+    """
+    fileobj.seek(0)
+    return next(ijson.items(fileobj, "info"), None) or {}
+
+
+def read_package_index(fileobj, extension):
+    """
+    Reads the info/index.json of a conda package.
+
+    Only the few KB of metadata are decompressed. For a ".conda" package only the inner
+    ``info-*.tar.zst`` member of the zip archive is read, the much larger ``pkg-*.tar.zst``
+    member is never touched. A ".tar.bz2" package is decompressed as a stream, which stops as
+    soon as the info/index.json entry has been read. conda-build stores the info/ entries first.
+
+    Args:
+        fileobj: A binary file object containing the package.
+        extension (str): The extension of the package, i.e. "conda" or "tar.bz2".
+
+    Returns:
+        dict: The content of the info/index.json of the package.
+
+    Raises:
+        ValueError: If the package does not contain an info/index.json.
+    """
+    if extension == "conda":
+        with zipfile.ZipFile(fileobj) as package:
+            info = next(
+                (
+                    name
+                    for name in package.namelist()
+                    if name.startswith("info-") and name.endswith(".tar.zst")
+                ),
+                None,
+            )
+            if info is None:
+                raise ValueError(_("The package does not contain an info archive."))
+            with package.open(info) as member:
+                reader = zstandard.ZstdDecompressor().stream_reader(member)
+                return _read_tar_index(reader, "r|")
+
+    return _read_tar_index(fileobj, "r|bz2")
+
+
+def _read_tar_index(fileobj, mode):
+    """
+    Reads info/index.json from a tar stream, without reading any entry after it.
+    """
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for member in tar:
+            if member.name == "info/index.json":
+                return json.load(tar.extractfile(member))
+    raise ValueError(_("The package does not contain an info/index.json."))
+
+
+def md5_hexdigest(fileobj):
+    """
+    Computes the md5 digest of a file, which conda still expects in every package record.
+
+    Args:
+        fileobj: A binary file object.
+
+    Returns:
+        str: The hex digest of the whole file.
+    """
+    fileobj.seek(0)
+    hasher = hashlib.md5(usedforsecurity=False)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def write_repodata(fileobj, subdir, packages, conda_packages):
+    """
+    Writes a repodata.json document one package record at a time.
+
+    Args:
+        fileobj: A text file object to write the document to.
+        subdir (str): The subdir the packages belong to, e.g. "noarch" or "linux-64".
+        packages: An iterable of ``(filename, record)`` tuples of ".tar.bz2" packages.
+        conda_packages: An iterable of ``(filename, record)`` tuples of ".conda" packages.
+    """
+    fileobj.write('{"info": ')
+    json.dump({"subdir": subdir}, fileobj)
+    for section, records in (("packages", packages), ("packages.conda", conda_packages)):
+        fileobj.write(f', "{section}": {{')
+        separator = ""
+        for filename, record in records:
+            fileobj.write(f"{separator}{json.dumps(filename)}: ")
+            json.dump(record, fileobj, sort_keys=True)
+            separator = ", "
+        fileobj.write("}")
+    fileobj.write(', "removed": [], "repodata_version": 1}')
+
+
+def write_channeldata(fileobj, subdirs, packages):
+    """
+    Writes a channeldata.json document one package entry at a time.
+
+    Args:
+        fileobj: A text file object to write the document to.
+        subdirs: The subdirs of the channel.
+        packages: An iterable of ``(name, entry)`` tuples, ordered by name.
+    """
+    fileobj.write('{"channeldata_version": 1, "packages": {')
+    separator = ""
+    for name, entry in packages:
+        fileobj.write(f"{separator}{json.dumps(name)}: ")
+        json.dump(entry, fileobj, sort_keys=True)
+        separator = ", "
+    fileobj.write('}, "subdirs": ')
+    json.dump(sorted(subdirs), fileobj)
+    fileobj.write("}")
+
+
+def record_fingerprint(record):
+    """
+    Returns the digest identifying a repodata.json package record, e.g. in a sync fingerprint.
+
+    The whole record is digested, so a patched record, e.g. with fixed ``depends``, is detected
+    even though the package file and its sha256 stay the same.
+    """
+    return hashlib.blake2b(
+        json.dumps(record, sort_keys=True).encode(), digest_size=16
+    ).digest()
+
+
+def encode_fingerprint(fingerprint):
+    """
+    Encodes the fingerprint of a repodata.json, i.e. the digest of every package filename.
+
+    Returns:
+        bytes: The zstd compressed msgpack document.
+    """
+    return zstandard.ZstdCompressor().compress(msgpack.packb(fingerprint, use_bin_type=True))
+
+
+def decode_fingerprint(data):
+    """
+    Decodes a fingerprint encoded by `encode_fingerprint`.
+
+    Returns:
+        dict: The digest of every package filename.
+    """
+    with zstandard.ZstdDecompressor().stream_reader(bytes(data)) as reader:
+        return msgpack.unpackb(reader.read(), raw=False)
@@ -0,0 +1,401 @@
+"""
+Conda version ordering and version specs, following the semantics of ``conda.models.version``.
+"""
+import operator
+import re
+from functools import lru_cache
+from gettext import gettext as _
+from itertools import zip_longest
+
+VERSION_CHECK_RE = re.compile(r"^[\*\.\+!_0-9a-z]+$")
+VERSION_SPLIT_RE = re.compile(r"([0-9]+|[*]+|[^0-9*]+)")
+VERSION_OPERATOR_RE = re.compile(r"^(==|!=|<=|>=|~=|<|>|=)?(.*)$")
+
+# Numbers are padded with this value, strings sort before it.
+FILLVALUE = 0
+
+# The classes of the parts of a version key. A run of padding zeros is followed by a string, which
+# sorts before the padding, by the end of the parts, or by a number, which sorts after it.
+_KEY_STRING, _KEY_END, _KEY_NUMBER = b"\x01", b"\x02", b"\x03"
+
+
+class InvalidVersion(ValueError):
+    """
+    Raised when a version or version spec string cannot be parsed.
+    """
+
+
+def _split_component(component, vstr):
+    parts = VERSION_SPLIT_RE.findall(component)
+    if not parts:
+        raise InvalidVersion(_("Invalid version: {}").format(vstr))
+
+    for i, part in enumerate(parts):
+        if part.isdigit():
+            parts[i] = int(part)
+        elif part == "post":
+            # "post" sorts after every number.
+            parts[i] = float("inf")
+        elif part == "dev":
+            # Upper case sorts "DEV" before any other string except "*".
+            parts[i] = "DEV"
+
+    if not component[0].isdigit():
+        # Keep numbers and strings in phase.
+        parts.insert(0, FILLVALUE)
+    return parts
+
+
+def _eq(t1, t2):
+    for v1, v2 in zip_longest(t1, t2, fillvalue=[]):
+        for c1, c2 in zip_longest(v1, v2, fillvalue=FILLVALUE):
+            if c1 != c2:
+                return False
+    return True
+
+
+def _lt(t1, t2):
+    for v1, v2 in zip_longest(t1, t2, fillvalue=[]):
+        for c1, c2 in zip_longest(v1, v2, fillvalue=FILLVALUE):
+            if c1 == c2:
+                continue
+            if isinstance(c1, str):
+                if not isinstance(c2, str):
+                    # Strings sort before numbers.
+                    return True
+            elif isinstance(c2, str):
+                return False
+            return c1 < c2
+    return None
+
+
+class VersionOrder:
+    """
+    A parsed conda version, which can be compared with other versions.
+
+    A version consists of an optional epoch ``N!``, the version itself and an optional local
+    version ``+local``. The version is split into components at dots and underscores, and every
+    component into runs of numbers and strings. Numbers are compared numerically, strings
+    lexicographically, and strings sort before numbers. The special strings "dev" and "post" sort
+    before and after everything else, respectively.
+    """
+
+    __slots__ = ("norm", "version", "local")
+
+    def __init__(self, vstr):
+        """
+        Args:
+            vstr (str): The version string.
+
+        Raises:
+            InvalidVersion: If the version string is not a valid conda version.
+        """
+        version = str(vstr).strip().lower()
+        if not version:
+            raise InvalidVersion(_("Empty version string."))
+        self.norm = version
+
+        version = version.replace("-", "_")
+        if not VERSION_CHECK_RE.match(version):
+            raise InvalidVersion(_("Invalid version: {}").format(vstr))
+
+        epoch, _sep, version = version.rpartition("!")
+        if epoch and not epoch.isdigit():
+            raise InvalidVersion(_("Invalid epoch: {}").format(vstr))
+
+        version, plus, local = version.partition("+")
+        if not version or (plus and not local) or "+" in local:
+            raise InvalidVersion(_("Invalid version: {}").format(vstr))
+
+        if version.endswith("_"):
+            # Openssl-like versions such as "1.0.1_" keep the trailing underscore.
+            components = version[:-1].replace("_", ".").split(".")
+            components[-1] += "_"
+        else:
+            components = version.replace("_", ".").split(".")
+        if "" in components:
+            raise InvalidVersion(_("Empty version component: {}").format(vstr))
+
+        self.version = [[int(epoch or 0)]] + [_split_component(c, vstr) for c in components]
+        self.local = (
+            [_split_component(c, vstr) for c in local.replace("_", ".").split(".")]
+            if local
+            else []
+        )
+
+    def __str__(self):
+        return self.norm
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}("{self.norm}")'
+
+    def __eq__(self, other):
+        return _eq(self.version, other.version) and _eq(self.local, other.local)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        result = _lt(self.version, other.version)
+        if result is None:
+            result = _lt(self.local, other.local)
+        return bool(result)
+
+    def __gt__(self, other):
+        return other < self
+
+    def __le__(self, other):
+        return not other < self
+
+    def __ge__(self, other):
+        return not self < other
+
+    def __hash__(self):
+        raise TypeError(_("VersionOrder is not hashable, use its norm instead."))
+
+    def sort_key(self):
+        """
+        Returns the version as bytes, which compare like the version itself.
+
+        Equal versions, e.g. "1.0" and "1", have the same key. Unlike `VersionOrder`, keys can be
+        stored in an indexed column and compared in SQL, see `Package.version_key`.
+        """
+        return _encode_parts(self.version, _encode_component) + _encode_parts(
+            self.local, _encode_component
+        )
+
+    def startswith(self, other):
+        """
+        Whether the components of this version start with all components of another version.
+
+        For example, "1.2.3" and "1.2rc1" start with "1.2" but "1.20" does not.
+        """
+        if other.local:
+            if not _eq(self.version, other.version):
+                return False
+            t1, t2 = self.local, other.local
+        else:
+            t1, t2 = self.version, other.version
+
+        n = len(t2) - 1
+        if not _eq(t1[:n], t2[:n]):
+            return False
+
+        c1 = t1[n] if len(t1) > n else [FILLVALUE]
+        c2 = t2[n]
+        m = len(c2) - 1
+        if not _eq([c1[:m]], [c2[:m]]):
+            return False
+
+        e1 = c1[m] if len(c1) > m else FILLVALUE
+        e2 = c2[m]
+        if isinstance(e2, str):
+            return isinstance(e1, str) and e1.startswith(e2)
+        return e1 == e2
+
+
+def _encode_number(number):
+    if number == float("inf"):
+        return b"\xff"
+    data = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return bytes([len(data)]) + data
+
+
+def _encode_element(element):
+    if isinstance(element, str):
+        return element.encode() + b"\x00"
+    return _encode_number(element)
+
+
+def _encode_component(component):
+    return _encode_parts(component, _encode_element)
+
+
+def _key_class(part):
+    """
+    Returns the key class of a number, a string or a component, or None for padding.
+    """
+    if isinstance(part, list):
+        return next(filter(None, map(_key_class, part)), None)
+    if isinstance(part, str):
+        return _KEY_STRING
+    return _KEY_NUMBER if part != FILLVALUE else None
+
+
+def _encode_parts(parts, encode):
+    """
+    Encodes the components of a version or the elements of a component.
+
+    Comparisons pad the shorter side with zeros, so runs of padding are encoded along with the
+    class of the part following them: the longer a run before a string, the later it sorts, the
+    longer a run before a number, the earlier it sorts.
+    """
+    result = []
+    padding = 0
+    for part in parts:
+        key_class = _key_class(part)
+        if key_class is None:
+            padding += 1
+            continue
+        run = padding if key_class == _KEY_STRING else 0xFFFF - padding
+        result.append(key_class + run.to_bytes(2, "big") + encode(part))
+        padding = 0
+    result.append(_KEY_END)
+    return b"".join(result)
+
+
+@lru_cache(maxsize=65536)
+def version_key(vstr):
+    """
+    Returns the sort key of a version string, see `VersionOrder.sort_key`.
+
+    Args:
+        vstr (str): The version string.
+
+    Returns:
+        bytes: The key, or None if the version is invalid.
+    """
+    try:
+        return parse_version(vstr).sort_key()
+    except InvalidVersion:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def parse_version(vstr):
+    """
+    Parses a version string, caching the result.
+
+    Args:
+        vstr (str): The version string.
+
+    Returns:
+        VersionOrder: The parsed version.
+    """
+    return VersionOrder(vstr)
+
+
+def _compatible(version, spec):
+    # "~=1.2.3" is equivalent to ">=1.2.3,1.2.*".
+    if version < spec:
+        return False
+    components = spec.norm.split("+")[0].split(".")
+    if len(components) < 2:
+        return True
+    return version.startswith(parse_version(".".join(components[:-1])))
+
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+    "~=": _compatible,
+}
+
+
+class VersionSpec:
+    """
+    A conda version spec, e.g. ">=1.2,<2", "1.2.*" or "1.2|1.4".
+
+    Constraints are combined with "," (and) and "|" (or), where "," binds more tightly.
+    Parentheses can be used for grouping.
+    """
+
+    __slots__ = ("spec", "_match")
+
+    def __init__(self, spec):
+        """
+        Args:
+            spec (str): The version spec string.
+
+        Raises:
+            InvalidVersion: If the spec string cannot be parsed.
+        """
+        self.spec = re.sub(r"\s+", "", str(spec))
+        tokens = [token for token in re.split(r"([(),|])", self.spec) if token]
+        self._match, rest = _parse_or(tokens, self.spec)
+        if rest:
+            raise InvalidVersion(_("Invalid version spec: {}").format(spec))
+
+    def __str__(self):
+        return self.spec
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}("{self.spec}")'
+
+    def match(self, version):
+        """
+        Whether a version matches the spec.
+
+        Args:
+            version (str or VersionOrder): The version to test.
+
+        Returns:
+            bool: False for versions that cannot be parsed.
+        """
+        if not isinstance(version, VersionOrder):
+            try:
+                version = parse_version(version)
+            except InvalidVersion:
+                return False
+        return self._match(version)
+
+
+def _parse_or(tokens, spec):
+    matchers = []
+    match, tokens = _parse_and(tokens, spec)
+    matchers.append(match)
+    while tokens and tokens[0] == "|":
+        match, tokens = _parse_and(tokens[1:], spec)
+        matchers.append(match)
+    if len(matchers) == 1:
+        return matchers[0], tokens
+    return (lambda version: any(m(version) for m in matchers)), tokens
+
+
+def _parse_and(tokens, spec):
+    matchers = []
+    match, tokens = _parse_term(tokens, spec)
+    matchers.append(match)
+    while tokens and tokens[0] == ",":
+        match, tokens = _parse_term(tokens[1:], spec)
+        matchers.append(match)
+    if len(matchers) == 1:
+        return matchers[0], tokens
+    return (lambda version: all(m(version) for m in matchers)), tokens
+
+
+def _parse_term(tokens, spec):
+    if not tokens or tokens[0] in "),|":
+        raise InvalidVersion(_("Invalid version spec: {}").format(spec))
+    if tokens[0] == "(":
+        match, tokens = _parse_or(tokens[1:], spec)
+        if not tokens or tokens[0] != ")":
+            raise InvalidVersion(_("Unbalanced parentheses in version spec: {}").format(spec))
+        return match, tokens[1:]
+    return _parse_constraint(tokens[0], spec), tokens[1:]
+
+
+def _parse_constraint(constraint, spec):
+    if constraint in ("*", "=*", "==*"):
+        return lambda version: True
+
+    op, vstr = VERSION_OPERATOR_RE.match(constraint).groups()
+    if not vstr or (vstr.startswith("^") and vstr.endswith("$")):
+        raise InvalidVersion(_("Unsupported version spec: {}").format(spec))
+
+    startswith = vstr.endswith("*")
+    if startswith:
+        vstr = vstr.rstrip("*").rstrip(".")
+    version = parse_version(vstr)
+
+    if op in (None, "==", "=") and (startswith or op == "="):
+        return lambda v: v.startswith(version)
+    if op == "!=" and startswith:
+        return lambda v: not v.startswith(version)
+    # Bare versions are exact, a trailing ".*" after an ordering operator is ignored.
+    compare = OPERATORS[op or "=="]
+    return lambda v: compare(v, version)
@@ -1,8 +1,16 @@
-from django.db import transaction
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from gettext import gettext as _
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django_filters import CharFilter
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
 from pulpcore.plugin.viewsets import RemoteFilter
@@ -13,11 +21,12 @@ from pulpcore.plugin.serializers import (
     RepositorySyncURLSerializer,
 )
 from pulpcore.plugin.tasking import dispatch
-from pulpcore.plugin.models import ContentArtifact, Artifact, PulpTemporaryFile
+from pulpcore.plugin.models import ContentArtifact, Artifact, PulpTemporaryFile, Upload
+from pulpcore.plugin.util import get_domain, get_url
 
 
 from . import models, serializers, tasks
-
+from .files import PackageUploadHandler, hashed_upload, uploaded_artifact, uploaded_md5
 from .utils import extract_package_info
 
 
@@ -28,9 +37,15 @@ class PackageFilter(core.ContentFilter):
 
     class Meta:
         model = models.Package
-        fields = [
-            # ...
-        ]
+        fields = {
+            "name": ["exact", "in"],
+            "version": ["exact"],
+            "build": ["exact"],
+            "extension": ["exact"],
+            "subdir": ["exact", "in"],
+            "noarch": ["exact"],
+            "sha256": ["exact"],
+        }
 
 
 class PackageViewSet(core.SingleArtifactContentUploadViewSet):
@@ -53,8 +68,15 @@ class PackageViewSet(core.SingleArtifactContentUploadViewSet):
     def create(self, request):
         """
         Handle conda package upload.
+
+        The package is hashed while the request body streams in, and stored by moving the
+        uploaded file into the artifact storage.
         """
 
+        request.upload_handlers = [PackageUploadHandler(request)]
+        if request.data.get("upload"):
+            return self._create_from_upload(request)
+
         file = request.data["file"]
         repository_name = request.data["repository"]
 
@@ -68,13 +90,6 @@ class PackageViewSet(core.SingleArtifactContentUploadViewSet):
 
         repository = models.CondaRepository.objects.get(name=repository_name)
 
-        # This fails if an artifact with the same digest and pulp_domain_id already exists.
-        try:
-            temp_file = PulpTemporaryFile(file=file)
-            artifact = Artifact.from_pulp_temporary_file(temp_file)
-        except Exception:
-            temp_file.delete()
-
         data = {
             "name": name,
             "version": version,
@@ -86,40 +101,266 @@ class PackageViewSet(core.SingleArtifactContentUploadViewSet):
         serializer = serializers.PackageSerializer(data=data)
         serializer.is_valid(raise_exception=True)
 
-        # We check if the package already exists in the specified repository
-        package = models.Package.objects.filter(name=name, version=version, build=build, extension=extension, repositories=repository).first()
+        artifact, metadata = _save_artifact(file.name, file)
+
+        # We check if the package already exists in the specified repository. The subdir is
+        # part of the check, because a channel repository holds the same filename per subdir.
+        package = models.Package.objects.filter(
+            name=name,
+            version=version,
+            build=build,
+            extension=extension,
+            subdir=metadata["subdir"],
+            repositories=repository,
+        ).first()
         if not package:
-            try:
-                package = models.Package(
-                    name = name,
-                    version = version,
-                    build = build,
-                    extension = extension,
-                )
-
-                # This fails if a package with these values already exists, e.g. in another repository.
-                package.save()
-
-                ContentArtifact.objects.create(
-                    content = package,
-                    artifact = artifact,
-                    relative_path = package.relative_path,
-                )
-            except Exception:
-                # We now know that the package exists and fetch it.
-                package = models.Package.objects.filter(name=name, version=version, build=build, extension=extension).first()
+            package = _get_or_create_package(file.name, artifact, metadata)
 
             # Attach the package to the specified repository.
-            result = dispatch(
-                tasks.publish_package,
-                kwargs = {"repository_pk": repository.pk, "package_pk": package.pk},
-                exclusive_resources = [repository, package],
-            )
+            result = _attach_package(repository, package)
 
             return core.OperationPostponedResponse(result, request)
         else:
             return Response("Package already exists in specified repository.")
 
+    def _create_from_upload(self, request):
+        """
+        Dispatch a task creating a package from the chunks of a completed upload.
+
+        The chunks can be uploaded in parallel and resumed using the upload API of pulpcore.
+        """
+        serializer = serializers.PackageChunkedUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        upload = self.get_resource(data["upload"], Upload)
+        repository = models.CondaRepository.objects.filter(name=data["repository"]).first()
+        if repository is None:
+            raise ValidationError({"repository": _("Repository not found.")})
+        if None in extract_package_info(data["filename"]):
+            raise ValidationError(
+                {"filename": _("Invalid conda package filename: {}").format(data["filename"])}
+            )
+
+        result = dispatch(
+            tasks.upload_package,
+            kwargs={
+                "upload_pk": upload.pk,
+                "filename": data["filename"],
+                "repository_pk": repository.pk,
+            },
+            exclusive_resources=[upload, repository],
+        )
+        return core.OperationPostponedResponse(result, request)
+
+    @extend_schema(
+        description="Trigger an asynchronous task to add many uploaded conda packages to a "
+        "repository in a single new repository version.",
+        summary="Upload many packages",
+        request=serializers.PackageBatchUploadSerializer,
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    @action(
+        detail=False, methods=["post"], serializer_class=serializers.PackageBatchUploadSerializer
+    )
+    def batch(self, request):
+        """
+        Handle the upload of many conda packages at once.
+
+        The artifacts are hashed and stored in parallel. A single task then adds all packages to
+        one new repository version.
+        """
+        request.upload_handlers = [PackageUploadHandler(request)]
+        serializer = serializers.PackageBatchUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        repository_name = serializer.validated_data["repository"]
+        repository = models.CondaRepository.objects.filter(name=repository_name).first()
+        if repository is None:
+            raise ValidationError({"repository": _("Repository not found.")})
+
+        uploads = [(file.name, file) for file in serializer.validated_data.get("files", [])]
+        if serializer.validated_data.get("archive"):
+            uploads.extend(_extract_archive(serializer.validated_data["archive"]))
+
+        invalid = [filename for filename, file in uploads if None in extract_package_info(filename)]
+        if invalid:
+            raise ValidationError(
+                _("Invalid conda package filenames: {}").format(", ".join(invalid))
+            )
+
+        with ThreadPoolExecutor(max_workers=settings.CONDA_UPLOAD_WORKERS) as executor:
+            futures = [
+                executor.submit(copy_context().run, _store_artifact, filename, file)
+                for filename, file in uploads
+            ]
+            stored = [future.result() for future in futures]
+
+        package_pks = [
+            str(_get_or_create_package(filename, artifact, metadata).pk)
+            for filename, artifact, metadata in stored
+        ]
+
+        result = dispatch(
+            tasks.add_packages,
+            kwargs={"repository_pk": repository.pk, "package_pks": package_pks},
+            exclusive_resources=[repository],
+        )
+        return core.OperationPostponedResponse(result, request)
+
+
+    @extend_schema(
+        description="Check whether Pulp already has a conda package before uploading it. If it "
+        "does and a repository is given, a task adding the package to the repository is "
+        "dispatched, so the package does not need to be uploaded.",
+        summary="Negotiate a package upload",
+        request=serializers.PackageNegotiateSerializer,
+        responses={200: serializers.PackageNegotiateResponseSerializer},
+    )
+    @action(
+        detail=False, methods=["post"], serializer_class=serializers.PackageNegotiateSerializer
+    )
+    def negotiate(self, request):
+        """
+        Look up a conda package by its digest, and attach it to a repository if it exists.
+        """
+        serializer = serializers.PackageNegotiateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        repository = None
+        if data.get("repository"):
+            repository = models.CondaRepository.objects.filter(name=data["repository"]).first()
+            if repository is None:
+                raise ValidationError({"repository": _("Repository not found.")})
+
+        filename = "{name}-{version}-{build}.{extension}".format(**data)
+        if None in extract_package_info(filename):
+            raise ValidationError(_("Invalid conda package: {}").format(filename))
+
+        artifact = Artifact.objects.filter(
+            sha256=data["sha256"], size=data["size"], pulp_domain=get_domain()
+        ).first()
+        # The same filename can exist in several subdirs, the digest tells them apart.
+        package = models.Package.objects.filter(
+            name=data["name"],
+            version=data["version"],
+            build=data["build"],
+            extension=data["extension"],
+            sha256=data["sha256"],
+            _pulp_domain=get_domain(),
+        ).first()
+
+        if package is None and artifact is not None:
+            # The bytes are already stored, e.g. by an upload whose package was deleted later, so
+            # only the metadata needs to be read.
+            extension = data["extension"]
+            try:
+                metadata = models.Package.metadata_from_artifact(artifact, extension)
+            except ValueError as exc:
+                raise ValidationError(_("Invalid conda package {}: {}").format(filename, exc))
+            package = _get_or_create_package(filename, artifact, metadata)
+
+        task = None
+        if package is not None and repository is not None:
+            task = _attach_package(repository, package)
+
+        result = {
+            "artifact_exists": artifact is not None,
+            "package": get_url(package) if package is not None else None,
+            "task": get_url(task) if task is not None else None,
+        }
+        return Response(serializers.PackageNegotiateResponseSerializer(result).data)
+
+
+def _attach_package(repository, package):
+    """
+    Dispatches a task adding a package to a repository.
+    """
+    if settings.CONDA_COALESCE_UPLOADS:
+        # The first queued task adds the packages of all concurrent uploads.
+        try:
+            with transaction.atomic():
+                models.PendingPackage.objects.get_or_create(repository=repository, package=package)
+        except IntegrityError:
+            # A concurrent upload of the same package queued it already.
+            pass
+        exclusive_resources = [repository]
+    else:
+        exclusive_resources = [repository, package]
+    return dispatch(
+        tasks.publish_package,
+        kwargs={"repository_pk": repository.pk, "package_pk": package.pk},
+        exclusive_resources=exclusive_resources,
+    )
+
+
+def _get_or_create_package(filename, artifact, metadata):
+    """
+    Returns the Package of an uploaded artifact, see `Package.get_or_create_from_artifact`.
+    """
+    try:
+        return models.Package.get_or_create_from_artifact(filename, artifact, metadata)
+    except ValueError as exc:
+        raise ValidationError(str(exc))
+
+
+def _extract_archive(archive):
+    """
+    Extracts the regular files of an uploaded tar archive to temporary files, hashing them.
+    """
+    uploads = []
+    try:
+        with tarfile.open(fileobj=archive, mode="r:*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                filename = os.path.basename(member.name)
+                upload = hashed_upload(filename, tar.extractfile(member), member.size)
+                uploads.append((filename, upload))
+    except tarfile.TarError:
+        raise ValidationError({"archive": _("The archive is not a valid tar archive.")})
+    return uploads
+
+
+def _store_artifact(filename, file):
+    """
+    Hashes an uploaded package, reads its metadata and stores its artifact.
+
+    This runs in a worker thread, which closes its own database connection when done.
+    """
+    try:
+        return (filename, *_save_artifact(filename, file))
+    finally:
+        connection.close()
+
+
+def _save_artifact(filename, file):
+    """
+    Reads the metadata of an uploaded package and saves its artifact.
+
+    The digests computed by `PackageUploadHandler` while the package was uploaded are used, and
+    only the info/ metadata of the package is read.
+
+    Returns:
+        tuple: The artifact, which may have existed before, and the metadata of the package.
+    """
+    extension = extract_package_info(filename)[3]
+    artifact = uploaded_artifact(file)
+    try:
+        metadata = models.Package.metadata_from_file(
+            file, extension, artifact, md5=uploaded_md5(file)
+        )
+    except ValueError as exc:
+        raise ValidationError(_("Invalid conda package {}: {}").format(filename, exc))
+    try:
+        with transaction.atomic():
+            artifact.save()
+    except IntegrityError:
+        artifact = Artifact.objects.get(sha256=artifact.sha256, pulp_domain=get_domain())
+    return artifact, metadata
+
+
 class RepodataFilter(core.ContentFilter):
     """
     FilterSet for Repodata.
@@ -255,6 +496,15 @@ class CondaRepositoryViewSet(core.RepositoryViewSet, ModifyRepositoryActionMixin
         remote = serializer.validated_data.get("remote")
         mirror = serializer.validated_data.get("mirror")
 
+        if remote.cast().subdirs and not repository.channel:
+            raise ValidationError(
+                {
+                    "remote": _(
+                        "A remote with subdirs can only be synced into a channel repository."
+                    )
+                }
+            )
+
         result = dispatch(
             tasks.synchronize,
             [repository, remote],
@@ -304,11 +554,12 @@ class CondaPublicationViewSet(core.PublicationViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         repository_version = serializer.validated_data.get("repository_version")
+        sharded = serializer.validated_data.get("sharded")
 
         result = dispatch(
             tasks.publish,
             [repository_version.repository],
-            kwargs={"repository_version_pk": str(repository_version.pk)},
+            kwargs={"repository_version_pk": str(repository_version.pk), "sharded": sharded},
         )
         return core.OperationPostponedResponse(result, request)
 
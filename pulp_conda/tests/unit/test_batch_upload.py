@@ -0,0 +1,70 @@
+import hashlib
+import io
+import json
+import tarfile
+
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ValidationError
+
+from pulp_conda.app.files import uploaded_artifact, uploaded_md5
+from pulp_conda.app.models import Package
+from pulp_conda.app.viewsets import _extract_archive
+
+
+def _tar(members, mode):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def _package(name, version, build):
+    index = {"name": name, "version": version, "build": build, "subdir": "noarch"}
+    return _tar({"info/index.json": json.dumps(index).encode()}, "w:bz2").getvalue()
+
+
+class TestExtractArchive(SimpleTestCase):
+    """
+    Test the extraction of the packages of an archive uploaded to the batch endpoint.
+    """
+
+    def setUp(self):
+        self.packages = {
+            "foo-1.0-0.tar.bz2": _package("foo", "1.0", "0"),
+            "bar-2.1-py_0.tar.bz2": _package("bar", "2.1", "py_0"),
+        }
+        self.archive = _tar(
+            {f"packages/{filename}": data for filename, data in self.packages.items()}, "w:gz"
+        )
+
+    def test_members_are_hashed(self):
+        uploads = dict(_extract_archive(self.archive))
+
+        self.assertEqual(set(uploads), set(self.packages))
+        for filename, upload in uploads.items():
+            data = self.packages[filename]
+            self.assertEqual(upload.read(), data)
+            sha256 = hashlib.sha256(data).hexdigest()
+            self.assertEqual(upload.hashers["sha256"].hexdigest(), sha256)
+            self.assertEqual(uploaded_md5(upload), hashlib.md5(data).hexdigest())
+
+    def test_members_are_valid_artifacts(self):
+        for filename, upload in _extract_archive(self.archive):
+            artifact = uploaded_artifact(upload)
+            metadata = Package.metadata_from_file(
+                upload, "tar.bz2", artifact, md5=uploaded_md5(upload)
+            )
+
+            data = self.packages[filename]
+            self.assertEqual(artifact.sha256, hashlib.sha256(data).hexdigest())
+            self.assertEqual(artifact.size, len(data))
+            self.assertEqual(metadata["sha256"], artifact.sha256)
+            self.assertEqual(metadata["subdir"], "noarch")
+
+    def test_invalid_archive(self):
+        with self.assertRaises(ValidationError):
+            _extract_archive(io.BytesIO(b"not an archive"))
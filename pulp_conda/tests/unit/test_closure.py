@@ -0,0 +1,73 @@
+from django.test import SimpleTestCase
+
+from pulp_conda.app.closure import PackageIndex, dependency_closure
+from pulp_conda.app.match_spec import MatchSpec
+
+
+def _index(packages):
+    index = PackageIndex()
+    for subdir, name, version, build, depends in packages:
+        record = {
+            "name": name,
+            "version": version,
+            "build": build,
+            "build_number": 0,
+            "depends": depends,
+        }
+        index.add(subdir, f"{name}-{version}-{build}.conda", record)
+    return index
+
+
+class TestDependencyClosure(SimpleTestCase):
+    """
+    Test selecting the packages matching root specs and their transitive dependencies.
+    """
+
+    def setUp(self):
+        self.index = _index(
+            [
+                ("linux-64", "app", "1.0", "0", ["lib >=1", "tool"]),
+                ("linux-64", "app", "2.0", "0", ["lib >=2", "tool"]),
+                ("linux-64", "lib", "1.5", "0", []),
+                ("linux-64", "lib", "2.1", "0", []),
+                ("linux-64", "lib", "2.1", "1", []),
+                ("linux-64", "unrelated", "1.0", "0", []),
+                ("osx-64", "app", "2.0", "0", ["lib >=2", "tool"]),
+                ("osx-64", "lib", "2.0", "0", []),
+                ("noarch", "tool", "0.9", "0", []),
+                ("noarch", "tool", "1.0", "0", ["helper"]),
+                ("noarch", "helper", "3.0", "0", []),
+            ]
+        )
+
+    def test_closure(self):
+        selected = dependency_closure(self.index, [MatchSpec("app")])
+
+        self.assertEqual(
+            selected["linux-64"],
+            {
+                "app-1.0-0.conda",
+                "app-2.0-0.conda",
+                # All builds of the latest matching version.
+                "lib-2.1-0.conda",
+                "lib-2.1-1.conda",
+            },
+        )
+        # Every platform resolves its dependencies on its own, together with noarch.
+        self.assertEqual(selected["osx-64"], {"app-2.0-0.conda", "lib-2.0-0.conda"})
+        self.assertEqual(selected["noarch"], {"tool-1.0-0.conda", "helper-3.0-0.conda"})
+
+    def test_root_spec_version(self):
+        selected = dependency_closure(self.index, [MatchSpec("app <2")])
+
+        self.assertEqual(
+            selected["linux-64"], {"app-1.0-0.conda", "lib-2.1-0.conda", "lib-2.1-1.conda"}
+        )
+        self.assertNotIn("osx-64", selected)
+
+    def test_invalid_versions_are_ignored(self):
+        index = _index([("noarch", "bad", "1..0", "0", []), ("noarch", "bad", "1.0", "0", [])])
+
+        selected = dependency_closure(index, [MatchSpec("bad")])
+
+        self.assertEqual(selected["noarch"], {"bad-1.0-0.conda"})
@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase
+
+from pulp_conda.app.tasks.publishing import _select_current
+from pulp_conda.app.version import version_key
+
+
+def _rows(packages):
+    """
+    Returns the rows of packages as `_current_packages` queries them, their pk is the filename.
+    """
+    rows = [
+        (f"{name}-{version}-{build}", name, version, version_key(version), build, 0, depends)
+        for name, version, build, depends in packages
+    ]
+    # Newest version first, packages with an invalid version last.
+    rows.sort(key=lambda row: row[3] or b"")
+    rows.reverse()
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+class TestCurrentRepodata(SimpleTestCase):
+    """
+    Test selecting the packages of current_repodata.json.
+    """
+
+    def test_latest_version_per_name(self):
+        rows = _rows(
+            [
+                ("a", "1.0", "0", []),
+                ("a", "1.10", "0", []),
+                ("a", "1.9", "0", []),
+                ("a", "1.10", "1", []),
+                ("b", "2.0rc1", "0", []),
+                ("b", "2.0", "0", []),
+                ("b", "1!0.1", "0", []),
+            ]
+        )
+
+        self.assertEqual(_select_current(rows), {"a-1.10-0", "a-1.10-1", "b-1!0.1-0"})
+
+    def test_unsatisfied_dependencies(self):
+        rows = _rows(
+            [
+                ("app", "2.0", "0", ["lib <2", "tool"]),
+                ("lib", "1.0", "0", []),
+                ("lib", "1.5", "0", []),
+                ("lib", "1.5", "1", []),
+                ("lib", "2.0", "0", []),
+                ("tool", "1.0", "0", []),
+                ("tool", "0.5", "0", []),
+            ]
+        )
+
+        # The latest lib does not satisfy app, so all builds of the latest one that does are
+        # selected as well. The latest tool already satisfies it.
+        self.assertEqual(
+            _select_current(rows),
+            {"app-2.0-0", "lib-2.0-0", "lib-1.5-0", "lib-1.5-1", "tool-1.0-0"},
+        )
+
+    def test_invalid_versions_are_ignored(self):
+        rows = _rows([("a", "1..0", "0", []), ("a", "0.1", "0", [])])
+
+        self.assertEqual(_select_current(rows), {"a-0.1-0"})
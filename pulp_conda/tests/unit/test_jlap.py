@@ -0,0 +1,130 @@
+import io
+import json
+from hashlib import blake2b
+
+from django.test import SimpleTestCase
+
+from pulp_conda.app.jlap import (
+    DEFAULT_IV,
+    diff_repodata,
+    patch_line,
+    read_jlap,
+    repodata_hash,
+    write_jlap,
+)
+
+
+def _repodata(packages, subdir="noarch"):
+    document = {"info": {"subdir": subdir}, "packages": {}, "packages.conda": packages}
+    return io.BytesIO(json.dumps(document).encode())
+
+
+class TestJlap(SimpleTestCase):
+    """
+    Test writing and reading repodata.jlap files.
+    """
+
+    def setUp(self):
+        self.patches = [
+            patch_line("a" * 64, "b" * 64, [{"op": "remove", "path": "/packages.conda/x"}]),
+            patch_line("b" * 64, "c" * 64, [{"op": "replace", "path": "/info", "value": {}}]),
+        ]
+
+    def test_round_trip(self):
+        jlap = io.BytesIO()
+        write_jlap(jlap, DEFAULT_IV, self.patches, "c" * 64, max_size=1024 * 1024)
+
+        jlap.seek(0)
+        iv, patches = read_jlap(jlap)
+
+        self.assertEqual(iv, DEFAULT_IV)
+        self.assertEqual(patches, self.patches)
+
+    def test_checksum_chaining(self):
+        jlap = io.BytesIO()
+        write_jlap(jlap, DEFAULT_IV, self.patches, "c" * 64, max_size=1024 * 1024)
+
+        lines = jlap.getvalue().decode().split("\n")
+        self.assertEqual(lines[0], DEFAULT_IV.hex())
+        self.assertEqual(lines[1:3], self.patches)
+        self.assertEqual(json.loads(lines[3]), {"url": "repodata.json", "latest": "c" * 64})
+        # The checksum of every line is keyed with the checksum of the line before.
+        checksum = DEFAULT_IV
+        for line in lines[1:-1]:
+            checksum = blake2b(line.encode(), key=checksum, digest_size=32).digest()
+        self.assertEqual(lines[-1], checksum.hex())
+
+    def test_trimming_keeps_the_chain(self):
+        full = io.BytesIO()
+        write_jlap(full, DEFAULT_IV, self.patches, "c" * 64, max_size=1024 * 1024)
+        trimmed = io.BytesIO()
+        write_jlap(trimmed, DEFAULT_IV, self.patches, "c" * 64, max_size=len(full.getvalue()) - 1)
+
+        trimmed.seek(0)
+        iv, patches = read_jlap(trimmed)
+
+        # The first patch is dropped, its checksum becomes the initialization vector.
+        self.assertEqual(patches, self.patches[1:])
+        self.assertEqual(
+            iv, blake2b(self.patches[0].encode(), key=DEFAULT_IV, digest_size=32).digest()
+        )
+        self.assertLess(len(trimmed.getvalue()), len(full.getvalue()))
+        self.assertEqual(trimmed.getvalue().split(b"\n")[-1], full.getvalue().split(b"\n")[-1])
+
+    def test_invalid_checksum(self):
+        jlap = io.BytesIO()
+        write_jlap(jlap, DEFAULT_IV, self.patches, "c" * 64, max_size=1024 * 1024)
+        data = jlap.getvalue().replace(b'"from"', b'"From"', 1)
+
+        self.assertEqual(read_jlap(io.BytesIO(data)), (DEFAULT_IV, []))
+        self.assertEqual(read_jlap(io.BytesIO(b"")), (DEFAULT_IV, []))
+
+
+class TestDiffRepodata(SimpleTestCase):
+    """
+    Test computing the JSON patch between two repodata.json documents.
+    """
+
+    def test_diff(self):
+        old = _repodata(
+            {
+                "a-1.0-0.conda": {"name": "a", "depends": []},
+                "b-1.0-0.conda": {"name": "b", "depends": []},
+            }
+        )
+        new = _repodata(
+            {
+                "a-1.0-0.conda": {"name": "a", "depends": ["c"]},
+                "c-1.0-0.conda": {"name": "c", "depends": []},
+            },
+            subdir="linux-64",
+        )
+
+        patch = diff_repodata(old, new)
+
+        self.assertCountEqual(
+            patch,
+            [
+                {"op": "replace", "path": "/info", "value": {"subdir": "linux-64"}},
+                {
+                    "op": "add",
+                    "path": "/packages.conda/a-1.0-0.conda",
+                    "value": {"name": "a", "depends": ["c"]},
+                },
+                {
+                    "op": "add",
+                    "path": "/packages.conda/c-1.0-0.conda",
+                    "value": {"name": "c", "depends": []},
+                },
+                {"op": "remove", "path": "/packages.conda/b-1.0-0.conda"},
+            ],
+        )
+
+    def test_unchanged(self):
+        packages = {"a-1.0-0.conda": {"name": "a"}}
+
+        self.assertEqual(diff_repodata(_repodata(packages), _repodata(packages)), [])
+        self.assertEqual(
+            repodata_hash(_repodata(packages)),
+            blake2b(_repodata(packages).getvalue(), digest_size=32).hexdigest(),
+        )
@@ -0,0 +1,90 @@
+from django.test import SimpleTestCase
+
+from pulp_conda.app.match_spec import InvalidMatchSpec, MatchSpec
+
+
+class TestMatchSpec(SimpleTestCase):
+    """
+    Test parsing conda match specs and matching packages against them.
+    """
+
+    def assertMatches(self, spec, packages):
+        spec = MatchSpec(spec)
+        for package, expected in packages:
+            with self.subTest(spec=str(spec), package=package):
+                self.assertEqual(spec.match(*package), expected)
+
+    def test_name(self):
+        self.assertMatches(
+            "numpy",
+            [(("numpy", "1.26.4", "py312h0_0"), True), (("numpy-base", "1.26.4", "0"), False)],
+        )
+        self.assertMatches(
+            "lib*",
+            [(("libgcc", "13.2.0", "h0_0"), True), (("gcc", "13.2.0", "h0_0"), False)],
+        )
+
+    def test_space_separated(self):
+        self.assertMatches(
+            "numpy >=1.21,<2",
+            [(("numpy", "1.26.4", "0"), True), (("numpy", "2.0.0", "0"), False)],
+        )
+        self.assertMatches(
+            "numpy >= 1.21, < 2",
+            [(("numpy", "1.26.4", "0"), True), (("numpy", "1.20", "0"), False)],
+        )
+        # A bare version followed by a build is exact.
+        self.assertMatches(
+            "libblas 3.9.0 *mkl",
+            [
+                (("libblas", "3.9.0", "20_linux64_mkl"), True),
+                (("libblas", "3.9.0", "20_linux64_openblas"), False),
+                (("libblas", "3.9.0.1", "20_linux64_mkl"), False),
+            ],
+        )
+
+    def test_equals_separated(self):
+        # Without a build, the version is fuzzy.
+        self.assertMatches(
+            "python=3.11",
+            [
+                (("python", "3.11.8", "h0_0"), True),
+                (("python", "3.11", "h0_0"), True),
+                (("python", "3.1", "h0_0"), False),
+                (("python", "3.12.0", "h0_0"), False),
+            ],
+        )
+        self.assertMatches(
+            "python=3.11.8=h0_0",
+            [(("python", "3.11.8", "h0_0"), True), (("python", "3.11.8", "h0_1"), False)],
+        )
+        self.assertMatches(
+            "python==3.11",
+            [(("python", "3.11.0", "h0_0"), True), (("python", "3.11.8", "h0_0"), False)],
+        )
+
+    def test_bracket(self):
+        self.assertMatches(
+            "numpy[version='>=1.21,<2', build=py312*]",
+            [
+                (("numpy", "1.26.4", "py312h0_0"), True),
+                (("numpy", "1.26.4", "py311h0_0"), False),
+                (("numpy", "2.0.0", "py312h0_0"), False),
+            ],
+        )
+        self.assertMatches(
+            'zlib[build_number="2"]',
+            [(("zlib", "1.3", "h0_2", 2), True), (("zlib", "1.3", "h0_1", 1), False)],
+        )
+
+    def test_channel_and_comment(self):
+        self.assertMatches(
+            "conda-forge::numpy >=1.21  # comment",
+            [(("numpy", "1.26.4", "0"), True), (("numpy", "1.20", "0"), False)],
+        )
+
+    def test_invalid(self):
+        for spec in ("", ">=1.0", "numpy >=1..0"):
+            with self.subTest(spec=spec):
+                with self.assertRaises(InvalidMatchSpec):
+                    MatchSpec(spec)
@@ -0,0 +1,74 @@
+from django.test import SimpleTestCase
+
+from pulp_conda.app.utils import extract_package_info, parse_package_filename
+
+
+class TestParsePackageFilename(SimpleTestCase):
+    """
+    Test parsing the (relative) path of a conda package.
+    """
+
+    def test_valid(self):
+        package = parse_package_filename("numpy-1.26.4-py312h0_0.conda")
+
+        self.assertEqual(package.name, "numpy")
+        self.assertEqual(package.version, "1.26.4")
+        self.assertEqual(package.build, "py312h0_0")
+        self.assertEqual(package.extension, "conda")
+        self.assertEqual(package.build_number, 0)
+        self.assertIsNone(package.subdir)
+
+    def test_name_with_dashes(self):
+        package = parse_package_filename("python-dateutil-2.9.0-pyhd8ed1ab_12.tar.bz2")
+
+        self.assertEqual(package.name, "python-dateutil")
+        self.assertEqual(package.version, "2.9.0")
+        self.assertEqual(package.build, "pyhd8ed1ab_12")
+        self.assertEqual(package.extension, "tar.bz2")
+        self.assertEqual(package.build_number, 12)
+
+    def test_build_number(self):
+        self.assertEqual(parse_package_filename("foo-1.0-3.conda").build_number, 3)
+        self.assertIsNone(parse_package_filename("foo-1.0-main.conda").build_number)
+
+    def test_subdir(self):
+        package = parse_package_filename("linux-64/_libgcc_mutex-0.1-main.tar.bz2")
+        self.assertEqual(package.name, "_libgcc_mutex")
+        self.assertEqual(package.subdir, "linux-64")
+
+        package = parse_package_filename("channel/osx-arm64/foo-1.0-0.conda")
+        self.assertEqual(package.subdir, "osx-arm64")
+
+        for path in ("Linux/foo-1.0-0.conda", "-x/foo-1.0-0.conda", "x-/foo-1.0-0.conda"):
+            with self.subTest(path=path):
+                self.assertIsNone(parse_package_filename(path).subdir)
+
+    def test_malformed(self):
+        for path in (
+            "",
+            "conda",
+            ".conda",
+            "x/conda",
+            "tar.bz2",
+            "bz2",
+            "repodata.json",
+            "foo.conda",
+            "foo-1.0.conda",
+            "foo-1.0-0.zip",
+            "foo-1.0-0conda",
+            "foo-1.0-0.tar.bz2x",
+            "-1.0-0.conda",
+            "foo--0.conda",
+            "foo-1.0-.conda",
+            "foo bar-1.0-0.conda",
+            "foo-1.0-0-.conda",
+        ):
+            with self.subTest(path=path):
+                self.assertIsNone(parse_package_filename(path))
+                self.assertEqual(extract_package_info(path), (None, None, None, None))
+
+    def test_extract_package_info(self):
+        self.assertEqual(
+            extract_package_info("linux-64/foo-bar-1!2.0+local-h1_12.conda"),
+            ("foo-bar", "1!2.0+local", "h1_12", "conda"),
+        )
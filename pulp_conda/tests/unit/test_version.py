@@ -0,0 +1,100 @@
+from django.test import SimpleTestCase
+
+from pulp_conda.app.version import InvalidVersion, VersionOrder, VersionSpec, version_key
+
+# The version ordering documented by conda, see ``conda.models.version.VersionOrder``. Versions
+# within a group are equal.
+DOCUMENTED_ORDER = [
+    ["0.4", "0.4.0"],
+    ["0.4.1.rc", "0.4.1.RC"],
+    ["0.4.1"],
+    ["0.5a1"],
+    ["0.5b3"],
+    ["0.5C1"],
+    ["0.5"],
+    ["0.9.6"],
+    ["0.960923"],
+    ["1.0"],
+    ["1.1dev1"],
+    ["1.1_"],
+    ["1.1a1"],
+    ["1.1.0dev1", "1.1.dev1"],
+    ["1.1.a1"],
+    ["1.1.0rc1"],
+    ["1.1.0", "1.1"],
+    ["1.1.0post1", "1.1.post1"],
+    ["1.1post1"],
+    ["1996.07.12"],
+    ["1!0.4.1"],
+    ["1!3.1.1.6"],
+    ["2!0.4.1"],
+]
+
+
+class TestVersionOrder(SimpleTestCase):
+    """
+    Test the ordering of conda versions and their sort keys.
+    """
+
+    def assertOrdered(self, groups):
+        for i, group in enumerate(groups):
+            for vstr in group:
+                for other in group:
+                    with self.subTest(equal=(vstr, other)):
+                        self.assertEqual(VersionOrder(vstr), VersionOrder(other))
+                        self.assertEqual(version_key(vstr), version_key(other))
+                for later in (v for g in groups[i + 1 :] for v in g):
+                    with self.subTest(less=(vstr, later)):
+                        self.assertLess(VersionOrder(vstr), VersionOrder(later))
+                        self.assertLess(version_key(vstr), version_key(later))
+
+    def test_documented_order(self):
+        self.assertOrdered(DOCUMENTED_ORDER)
+
+    def test_epochs(self):
+        self.assertOrdered([["0!2.0", "2.0"], ["1!1.0"], ["1!1.0.1"], ["10!0.1"]])
+
+    def test_local_versions(self):
+        self.assertOrdered(
+            [["1.0+a"], ["1.0", "1.0+0"], ["1.0+1", "1.0+1.0"], ["1.0+1.1"], ["1.0+2"], ["1.1"]]
+        )
+
+    def test_dev_and_post(self):
+        self.assertOrdered(
+            [["1.0dev1"], ["1.0a1"], ["1.0rc1"], ["1.0"], ["1.0post1"], ["1.1dev1"], ["1.1"]]
+        )
+
+    def test_underscores(self):
+        self.assertOrdered(
+            [["1.0.1_", "1.0.1-"], ["1.0.1a"], ["1.0.1"], ["1.0.2_1", "1.0.2.1", "1.0.2-1"]]
+        )
+
+    def test_invalid(self):
+        for vstr in ("", "1..0", "1.0+", "a!1.0", "1.0+1+2", "1.0 beta", "1.0$"):
+            with self.subTest(vstr=vstr):
+                with self.assertRaises(InvalidVersion):
+                    VersionOrder(vstr)
+                self.assertIsNone(version_key(vstr))
+
+
+class TestVersionSpec(SimpleTestCase):
+    """
+    Test matching versions against version specs.
+    """
+
+    def test_match(self):
+        cases = [
+            ("1.2.*", "1.2.3", True),
+            ("1.2.*", "1.20", False),
+            (">=1.0,<2", "1.5", True),
+            (">=1.0,<2", "2.0", False),
+            ("<1.0|>=2.0", "2.1", True),
+            ("<1.0|>=2.0", "1.5", False),
+            ("~=1.2.3", "1.2.9", True),
+            ("~=1.2.3", "1.3", False),
+            ("!=1.0", "1.0.0", False),
+            ("1.0", "1.0.0", True),
+        ]
+        for spec, vstr, expected in cases:
+            with self.subTest(spec=spec, version=vstr):
+                self.assertEqual(VersionSpec(spec).match(vstr), expected)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the package filename parser on the content app request path.
+
+Every request to a pull-through distribution parses the requested path at least twice, in
+CondaRemote.get_remote_artifact_content_type and CondaDistribution.content_handler. This compares
+the per-call overhead of the uncached regex match the parser replaced with the cached parser, for
+hot paths (a few packages requested over and over) and cold paths (every path requested once).
+
+Run from the root of the repository:
+
+    PYTHONPATH=. python scripts/bench_filename_parser.py
+"""
+
+import argparse
+import re
+import timeit
+
+from pulp_conda.app.utils import extract_package_info, parse_package_filename
+
+# The parser before the compiled, cached one.
+LEGACY_PATTERN = r"^(?P<name>.+)-(?P<version>\d.+)-(?P<build>.+)\.(?P<extension>conda|tar\.bz2)$"
+
+PATHS = [
+    "linux-64/numpy-1.26.4-py312heda63a1_0.conda",
+    "noarch/python-dateutil-2.9.0-pyhd8ed1ab_0.tar.bz2",
+    "linux-64/ca-certificates-2024.2.2-hbcca054_0.conda",
+    "linux-64/_libgcc_mutex-0.1-conda_forge.tar.bz2",
+    "osx-arm64/libcxx-16.0.6-h4653b0c_0.conda",
+    "linux-64/repodata.json",
+]
+
+
+def legacy_extract_package_info(relative_path):
+    match = re.match(LEGACY_PATTERN, relative_path.rsplit("/", 1)[-1])
+    if match:
+        return match.group("name", "version", "build", "extension")
+    return None, None, None, None
+
+
+def cold_paths(count):
+    return [
+        f"linux-64/package-{i}-{i % 7}.{i % 13}.{i}-py312h{i:07x}_{i % 5}.conda"
+        for i in range(count)
+    ]
+
+
+def bench(label, function, paths, repeat):
+    number = len(paths)
+    best = min(
+        timeit.repeat(lambda: [function(path) for path in paths], number=1, repeat=repeat)
+    )
+    print(f"{label:<40} {best / number * 1e9:>10.0f} ns/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions, the best is shown")
+    parser.add_argument("--cold", type=int, default=100000, help="number of distinct paths")
+    args = parser.parse_args()
+
+    hot = PATHS * 20000
+    cold = cold_paths(args.cold)
+
+    print("hot paths")
+    bench("  legacy re.match", legacy_extract_package_info, hot, args.repeat)
+    bench("  parse_package_filename", parse_package_filename, hot, args.repeat)
+    bench("  extract_package_info", extract_package_info, hot, args.repeat)
+
+    print("cold paths")
+    bench("  legacy re.match", legacy_extract_package_info, cold, args.repeat)
+    parse_package_filename.cache_clear()
+    bench(
+        "  parse_package_filename (uncached)", parse_package_filename.__wrapped__, cold, args.repeat
+    )
+    bench("  parse_package_filename", parse_package_filename, cold, args.repeat)
+
+
+if __name__ == "__main__":
+    main()